@@ -20,6 +20,21 @@ class Settings(BaseSettings):
     xray_grpc_address: str = "xray:8080"
     xray_config_path: str = "/etc/xray/config.json"
     xray_port: int = 443
+    xray_inbound_tag: str = "vless-reality"
+    xray_grpc_timeout: float = 5.0  # Seconds per gRPC call
+    xray_grpc_keepalive: float = 30.0  # Seconds between keepalive pings on the shared channel
+    xray_config_write_window: float = 0.5  # Seconds to coalesce config rewrites
+    xray_config_pretty: bool = False  # Indented config file instead of streamed compact JSON
+    # Write config fragments here instead of xray_config_path (run Xray with -confdir)
+    xray_confdir: str = ""
+    throughput_sample_interval: float = 5.0  # Seconds between live throughput samples
+    throughput_samples: int = 60  # Samples kept per user for current/peak rates
+    monitoring_feed_interval: float = 5.0  # Seconds between frames on the monitoring WebSocket
+    monitoring_feed_queue: int = 2  # Frames buffered per WebSocket client; older ones are dropped
+    # Seconds the feed keeps rebuilding /monitoring/online-users after a request
+    monitoring_http_keep_warm: float = 90.0
+    # Without Xray online stats, users with traffic this recently count as online
+    online_window_minutes: int = 10
     
     # Reality Settings
     reality_dest: str = "www.microsoft.com:443"
@@ -33,6 +48,10 @@ class Settings(BaseSettings):
     # Logging
     log_retention_hours: int = 24
     log_path: str = "/var/log/xray"
+    access_log_ingest: bool = True  # Tail access.log into the access_logs table
+    access_log_poll_interval: float = 1.0  # Seconds between checks for new lines
+    access_log_batch_size: int = 5000  # Rows per insert transaction
+    domain_stats_retention_days: int = 30  # Hourly top-domains aggregates kept this long
     
     # API
     api_v1_prefix: str = "/api/v1"
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Create database engine
 engine = create_engine(
@@ -9,6 +13,15 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
 )
 
+if "sqlite" in settings.database_url:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets API reads run while the background writers commit"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -16,6 +29,15 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def dialect_insert(db, table):
+    """INSERT for the session's dialect, supporting ON CONFLICT DO UPDATE"""
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(table)
+
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -27,5 +49,140 @@ def get_db():
 
 def init_db():
     """Initialize database tables"""
+    detach_legacy_access_logs()
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    copy_legacy_access_logs()
+    index_domains()
+
+
+def add_missing_columns():
+    """
+    Add columns and indexes that were added to a model after its table was
+    created; create_all only creates missing tables.
+    New columns must be nullable or have a server default.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing_indexes = [index for index in table.indexes if index.name not in existing_indexes]
+        if not missing and not missing_indexes:
+            continue
+        
+        with engine.begin() as conn:
+            for column in missing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            for index in missing_indexes:
+                index.create(bind=conn, checkfirst=True)
 
+
+def detach_legacy_access_logs():
+    """
+    Rename an access_logs table from before the compact schema (UUID string
+    keys and inline domains) to access_logs_legacy, so create_all can create
+    the new one; copy_legacy_access_logs then moves the rows over.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("access_logs"):
+        return
+    columns = {column["name"] for column in inspector.get_columns("access_logs")}
+    if "user_key" in columns:
+        return
+    
+    logger.info("Migrating access_logs to the compact schema")
+    primary_key = inspector.get_pk_constraint("access_logs").get("name")
+    with engine.begin() as conn:
+        # Index and constraint names stay with the renamed table and would clash
+        for index in inspector.get_indexes("access_logs"):
+            conn.execute(text(f'DROP INDEX {index["name"]}'))
+        conn.execute(text("ALTER TABLE access_logs RENAME TO access_logs_legacy"))
+        if primary_key and engine.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE access_logs_legacy RENAME CONSTRAINT {primary_key} TO access_logs_legacy_pkey"))
+
+
+def copy_legacy_access_logs():
+    """
+    Fill user_keys, domains and access_logs from access_logs_legacy and drop
+    it, in one transaction. Rows of deleted users are not copied.
+    """
+    if not inspect(engine).has_table("access_logs_legacy"):
+        return
+    
+    if engine.dialect.name == "sqlite":
+        epoch = "CAST(strftime('%s', l.timestamp) AS INTEGER)"
+    else:
+        epoch = "CAST(EXTRACT(EPOCH FROM l.timestamp) AS BIGINT)"
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO user_keys (user_id) "
+            "SELECT DISTINCT l.user_id FROM access_logs_legacy l JOIN users u ON u.id = l.user_id "
+            "WHERE l.user_id NOT IN (SELECT user_id FROM user_keys)"
+        ))
+        conn.execute(text(
+            "INSERT INTO domains (name) "
+            "SELECT DISTINCT domain FROM access_logs_legacy "
+            "WHERE domain IS NOT NULL AND domain NOT IN (SELECT name FROM domains)"
+        ))
+        # In time order, so IDs increase with the timestamp like ingested rows
+        copied = conn.execute(text(
+            "INSERT INTO access_logs (user_key, domain_id, bytes_sent, bytes_received, timestamp) "
+            f"SELECT k.id, d.id, COALESCE(l.bytes_sent, 0), COALESCE(l.bytes_received, 0), {epoch} "
+            "FROM access_logs_legacy l "
+            "JOIN user_keys k ON k.user_id = l.user_id "
+            "LEFT JOIN domains d ON d.name = l.domain "
+            "ORDER BY l.timestamp"
+        )).rowcount
+        conn.execute(text("DROP TABLE access_logs_legacy"))
+    logger.info(f"Copied {copied} access log records to the compact schema")
+
+
+def index_domains():
+    """
+    Fill domains.reversed_name where it is missing (rows from before the
+    column or from copy_legacy_access_logs) and, on SQLite, create the FTS5
+    trigram index over domain names, kept in sync by triggers.
+    """
+    from app.utils.access_log import reverse_labels
+    
+    filled = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(text(
+                "SELECT id, name FROM domains WHERE reversed_name IS NULL LIMIT 10000"
+            )).all()
+            if not rows:
+                break
+            conn.execute(
+                text("UPDATE domains SET reversed_name = :reversed_name WHERE id = :id"),
+                [{"id": domain_id, "reversed_name": reverse_labels(name)} for domain_id, name in rows]
+            )
+            filled += len(rows)
+    if filled:
+        logger.info(f"Filled reversed names of {filled} domains")
+    
+    if engine.dialect.name != "sqlite" or inspect(engine).has_table("domains_fts"):
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE domains_fts USING fts5("
+                "name, content='domains', content_rowid='id', tokenize='trigram')"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER domains_fts_insert AFTER INSERT ON domains BEGIN "
+                "INSERT INTO domains_fts (rowid, name) VALUES (new.id, new.name); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER domains_fts_delete AFTER DELETE ON domains BEGIN "
+                "INSERT INTO domains_fts (domains_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+            ))
+            conn.execute(text("INSERT INTO domains_fts (domains_fts) VALUES ('rebuild')"))
+        logger.info("Created the domains_fts trigram index")
+    except OperationalError as e:
+        # FTS5 or its trigram tokenizer (SQLite 3.34+) is not compiled in
+        logger.warning(f"Substring domain searches will scan the dictionary: {e}")
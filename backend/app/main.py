@@ -4,6 +4,7 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.middleware.sessions import SessionMiddleware
+from sqlalchemy import text
 from app.config import settings
 from app.database import init_db
 from app.routers import auth, users, monitoring, subscriptions, xray
@@ -35,6 +36,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Keyset pagination cursor (monitoring logs)
 )
 
 # Add session middleware
@@ -88,7 +90,6 @@ async def startup_event():
     from app.services.reality_service import RealityService
     from app.services.routing_service import RoutingService
     from app.services.xray_service import XrayService
-    from app.models import User
     from pathlib import Path
     
     config_path = Path(settings.xray_config_path)
@@ -110,8 +111,7 @@ async def startup_event():
         routing_service = RoutingService()
         xray_service = XrayService(reality_service, routing_service)
         
-        users = db.query(User).filter(User.is_active == True).all()
-        xray_config = xray_service.generate_config(users)
+        xray_config = xray_service.generate_config_streamed(db)
         if xray_service.save_config(xray_config):
             logger.info("Xray config generated/updated successfully")
         else:
@@ -149,18 +149,62 @@ async def startup_event():
         replace_existing=True
     )
     
+    # Downsample per-user traffic buckets (minute -> hour -> day) every hour
+    def rollup_usage():
+        from app.services.usage_service import UsageService
+        db = SessionLocal()
+        try:
+            UsageService(db).rollup()
+        except Exception as e:
+            logger.error(f"Error rolling up traffic usage: {e}")
+        finally:
+            db.close()
+    
+    scheduler.add_job(
+        rollup_usage,
+        "interval",
+        hours=1,
+        id="usage_rollup",
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("Scheduler started for log rotation")
     
+    # Start the coalescing Xray config writer
+    from app.services.config_writer import config_writer
+    config_writer.start()
+    
+    # Open the shared Xray gRPC channel
+    from app.services.xray_grpc_client import xray_grpc
+    xray_grpc.connect()
+    
+    # Start sampling live per-user throughput
+    from app.services.throughput_service import throughput
+    throughput.start()
+    
+    # Start the shared producer behind the monitoring WebSocket
+    from app.services.monitoring_feed import monitoring_feed
+    monitoring_feed.start()
+    
+    # Start tailing the Xray access log into the database
+    if settings.access_log_ingest:
+        from app.services.log_ingester import log_ingester
+        log_ingester.start()
+    
     # Schedule Reality settings rotation
     from app.services.reality_service import RealityService
-    def rotate_reality():
+    async def rotate_reality():
         db = SessionLocal()
         try:
             reality_service = RealityService(db)
-            reality_service.rotate_reality_settings()
+            last_rotated = reality_service.get_or_create_config().last_rotated
+            config = reality_service.rotate_reality_settings()
+            rotated = config.last_rotated != last_rotated
         finally:
             db.close()
+        if rotated:
+            config_writer.mark_dirty(reload=True)
     
     scheduler.add_job(
         rotate_reality,
@@ -170,20 +214,19 @@ async def startup_event():
         replace_existing=True
     )
     
-    # Schedule stats sync from Xray
+    # Schedule stats sync from Xray (the gRPC read runs on the loop, the
+    # journal writes in the threadpool)
     from app.services.stats_service import StatsService
-    def sync_stats():
+    async def sync_stats():
         db = SessionLocal()
         try:
             stats_service = StatsService(db)
-            updated = stats_service.sync_all_users_stats()
+            updated = await stats_service.sync_all_users_stats()
             logger.info(f"Synced stats for {updated} users")
         except Exception as e:
             logger.error(f"Error syncing stats: {e}")
         finally:
             db.close()
-            if 'stats_service' in locals():
-                stats_service.close()
     
     scheduler.add_job(
         sync_stats,
@@ -199,6 +242,20 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutting down...")
+    from app.services.config_writer import config_writer
+    await config_writer.stop()
+    
+    from app.services.throughput_service import throughput
+    await throughput.stop()
+    
+    from app.services.log_ingester import log_ingester
+    await log_ingester.stop()
+    
+    from app.services.monitoring_feed import monitoring_feed
+    await monitoring_feed.stop()
+    
+    from app.services.xray_grpc_client import xray_grpc
+    await xray_grpc.close()
 
 
 # Include routers
@@ -230,23 +287,21 @@ async def health_check():
     # Check database
     try:
         db = SessionLocal()
-        db.execute("SELECT 1")
+        db.execute(text("SELECT 1"))
         db.close()
         health_status["database"] = "connected"
     except Exception as e:
         health_status["database"] = f"error: {str(e)}"
         health_status["status"] = "degraded"
     
-    # Check Xray gRPC
+    # Check Xray gRPC over the shared channel (bounded by the per-call deadline)
     try:
-        from app.services.xray_grpc_client import XrayGRPCClient
-        client = XrayGRPCClient()
-        if client.channel:
+        from app.services.xray_grpc_client import xray_grpc
+        if await xray_grpc.get_sys_stats() is not None:
             health_status["xray"] = "connected"
         else:
             health_status["xray"] = "disconnected"
             health_status["status"] = "degraded"
-        client.close()
     except Exception as e:
         health_status["xray"] = f"error: {str(e)}"
         health_status["status"] = "degraded"
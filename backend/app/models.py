@@ -1,10 +1,24 @@
-from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, ForeignKey, Text, JSON, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+import calendar
 import uuid
 from app.database import Base
 
 
+class EpochSeconds(TypeDecorator):
+    """Naive UTC datetime stored as integer Unix seconds instead of a 26-char string"""
+    impl = BigInteger
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        return None if value is None else calendar.timegm(value.utctimetuple())
+    
+    def process_result_value(self, value, dialect):
+        return None if value is None else datetime.utcfromtimestamp(value)
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -17,12 +31,12 @@ class User(Base):
     data_used = Column(BigInteger, default=0)
     expire_date = Column(DateTime, nullable=True)
     is_active = Column(Boolean, default=True)
+    last_active_at = Column(DateTime, nullable=True, index=True)  # Last stats sync that saw traffic
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     devices = relationship("Device", back_populates="user", cascade="all, delete-orphan")
-    access_logs = relationship("AccessLog", back_populates="user", cascade="all, delete-orphan")
 
 
 class Device(Base):
@@ -37,20 +51,95 @@ class Device(Base):
     
     # Relationships
     user = relationship("User", back_populates="devices")
+    
+    # Keyset pages newest first, for all devices or one user's
+    __table_args__ = (
+        Index("ix_devices_last_seen_id", "last_seen", "id"),
+        Index("ix_devices_user_id_last_seen_id", "user_id", "last_seen", "id"),
+    )
+
+
+class UserKey(Base):
+    """Integer surrogate for users.id, so access_logs rows do not repeat the UUID string"""
+    __tablename__ = "user_keys"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), unique=True, nullable=False)
+    
+    # Keys of deleted users are never handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class Domain(Base):
+    """Dictionary of access log domains, referenced from access_logs by ID"""
+    __tablename__ = "domains"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
+    # Labels in reverse ("com.googlevideo.rr1"), so suffix searches are index range scans
+    reversed_name = Column(String, nullable=True, index=True)
 
 
 class AccessLog(Base):
+    """One accepted connection (SNI logging); see AccessLogWriter and AccessLogService"""
     __tablename__ = "access_logs"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
-    domain = Column(String, nullable=True, index=True)  # SNI
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_key = Column(Integer, ForeignKey("user_keys.id"), nullable=False)
+    domain_id = Column(Integer, ForeignKey("domains.id"), nullable=True)  # SNI
     bytes_sent = Column(BigInteger, default=0)
     bytes_received = Column(BigInteger, default=0)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(EpochSeconds, default=datetime.utcnow, index=True)
     
-    # Relationships
-    user = relationship("User", back_populates="access_logs")
+    __table_args__ = (
+        Index("ix_access_logs_user_key_timestamp", "user_key", "timestamp"),
+        Index("ix_access_logs_domain_id_timestamp", "domain_id", "timestamp"),
+    )
+
+
+class DomainStat(Base):
+    """Access log visits and bytes per domain per hour, updated as logs are ingested"""
+    __tablename__ = "domain_stats"
+    
+    hour_bucket = Column(BigInteger, primary_key=True)  # Unix time (UTC) of the hour start
+    domain = Column(String, primary_key=True)
+    visits = Column(BigInteger, default=0)
+    bytes = Column(BigInteger, default=0)
+
+
+class LogCheckpoint(Base):
+    """How far the access log ingester has read a log file"""
+    __tablename__ = "log_checkpoints"
+    
+    path = Column(String, primary_key=True)
+    inode = Column(BigInteger, nullable=True)
+    offset = Column(BigInteger, default=0)  # Byte offset just past the last ingested line
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TrafficJournal(Base):
+    """Traffic deltas read (and reset) from Xray but not yet added to users.data_used"""
+    __tablename__ = "traffic_journal"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_uuid = Column(String, nullable=False, index=True)
+    uplink = Column(BigInteger, default=0)
+    downlink = Column(BigInteger, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TrafficBucket(Base):
+    """Per-user traffic summed over one minute/hour/day bucket (see UsageService)"""
+    __tablename__ = "traffic_buckets"
+    
+    step = Column(Integer, primary_key=True)  # Bucket width in seconds: 60, 3600 or 86400
+    user_id = Column(String, primary_key=True)
+    bucket_start = Column(BigInteger, primary_key=True)  # Unix time (UTC), multiple of step
+    uplink = Column(BigInteger, default=0)
+    downlink = Column(BigInteger, default=0)
+    
+    # Rollup and retention walk a tier by time across all users
+    __table_args__ = (Index("ix_traffic_buckets_step_start", "step", "bucket_start"),)
 
 
 class XrayConfig(Base):
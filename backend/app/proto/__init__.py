@@ -0,0 +1,4 @@
+# Vendored Xray-core gRPC API protos
+#
+# Regenerate the *_pb2 modules from the backend directory with:
+#   python -m grpc_tools.protoc -I. --python_out=. --grpc_python_out=. app/proto/*.proto
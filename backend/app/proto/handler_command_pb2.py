@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: app/proto/handler_command.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from app.proto import user_pb2 as app_dot_proto_dot_user__pb2
+from app.proto import typed_message_pb2 as app_dot_proto_dot_typed__message__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1f\x61pp/proto/handler_command.proto\x12\x19xray.app.proxyman.command\x1a\x14\x61pp/proto/user.proto\x1a\x1d\x61pp/proto/typed_message.proto\"<\n\x10\x41\x64\x64UserOperation\x12(\n\x04user\x18\x01 \x01(\x0b\x32\x1a.xray.common.protocol.User\"$\n\x13RemoveUserOperation\x12\r\n\x05\x65mail\x18\x01 \x01(\t\"W\n\x13\x41lterInboundRequest\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\x33\n\toperation\x18\x02 \x01(\x0b\x32 .xray.common.serial.TypedMessage\"\x16\n\x14\x41lterInboundResponse\"3\n\x15GetInboundUserRequest\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\r\n\x05\x65mail\x18\x02 \x01(\t\"C\n\x16GetInboundUserResponse\x12)\n\x05users\x18\x01 \x03(\x0b\x32\x1a.xray.common.protocol.User\"-\n\x1cGetInboundUsersCountResponse\x12\r\n\x05\x63ount\x18\x01 \x01(\x03\x32\x83\x03\n\x0eHandlerService\x12q\n\x0c\x41lterInbound\x12..xray.app.proxyman.command.AlterInboundRequest\x1a/.xray.app.proxyman.command.AlterInboundResponse\"\x00\x12x\n\x0fGetInboundUsers\x12\x30.xray.app.proxyman.command.GetInboundUserRequest\x1a\x31.xray.app.proxyman.command.GetInboundUserResponse\"\x00\x12\x83\x01\n\x14GetInboundUsersCount\x12\x30.xray.app.proxyman.command.GetInboundUserRequest\x1a\x37.xray.app.proxyman.command.GetInboundUsersCountResponse\"\x00\x42\x30Z.github.com/xtls/xray-core/app/proxyman/commandb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'app.proto.handler_command_pb2', _globals)
+if _descriptor._USE_C_DESCRIPTORS == False:
+  DESCRIPTOR._options = None
+  DESCRIPTOR._serialized_options = b'Z.github.com/xtls/xray-core/app/proxyman/command'
+  _globals['_ADDUSEROPERATION']._serialized_start=115
+  _globals['_ADDUSEROPERATION']._serialized_end=175
+  _globals['_REMOVEUSEROPERATION']._serialized_start=177
+  _globals['_REMOVEUSEROPERATION']._serialized_end=213
+  _globals['_ALTERINBOUNDREQUEST']._serialized_start=215
+  _globals['_ALTERINBOUNDREQUEST']._serialized_end=302
+  _globals['_ALTERINBOUNDRESPONSE']._serialized_start=304
+  _globals['_ALTERINBOUNDRESPONSE']._serialized_end=326
+  _globals['_GETINBOUNDUSERREQUEST']._serialized_start=328
+  _globals['_GETINBOUNDUSERREQUEST']._serialized_end=379
+  _globals['_GETINBOUNDUSERRESPONSE']._serialized_start=381
+  _globals['_GETINBOUNDUSERRESPONSE']._serialized_end=448
+  _globals['_GETINBOUNDUSERSCOUNTRESPONSE']._serialized_start=450
+  _globals['_GETINBOUNDUSERSCOUNTRESPONSE']._serialized_end=495
+  _globals['_HANDLERSERVICE']._serialized_start=498
+  _globals['_HANDLERSERVICE']._serialized_end=885
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: app/proto/stats_command.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1d\x61pp/proto/stats_command.proto\x12\x16xray.app.stats.command\".\n\x0fGetStatsRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05reset\x18\x02 \x01(\x08\"#\n\x04Stat\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03\">\n\x10GetStatsResponse\x12*\n\x04stat\x18\x01 \x01(\x0b\x32\x1c.xray.app.stats.command.Stat\"3\n\x11QueryStatsRequest\x12\x0f\n\x07pattern\x18\x01 \x01(\t\x12\r\n\x05reset\x18\x02 \x01(\x08\"@\n\x12QueryStatsResponse\x12*\n\x04stat\x18\x01 \x03(\x0b\x32\x1c.xray.app.stats.command.Stat\"\x11\n\x0fSysStatsRequest\"\xc2\x01\n\x10SysStatsResponse\x12\x14\n\x0cNumGoroutine\x18\x01 \x01(\r\x12\r\n\x05NumGC\x18\x02 \x01(\r\x12\r\n\x05\x41lloc\x18\x03 \x01(\x04\x12\x12\n\nTotalAlloc\x18\x04 \x01(\x04\x12\x0b\n\x03Sys\x18\x05 \x01(\x04\x12\x0f\n\x07Mallocs\x18\x06 \x01(\x04\x12\r\n\x05\x46rees\x18\x07 \x01(\x04\x12\x13\n\x0bLiveObjects\x18\x08 \x01(\x04\x12\x14\n\x0cPauseTotalNs\x18\t \x01(\x04\x12\x0e\n\x06Uptime\x18\n \x01(\r\"\xa4\x01\n\x1cGetStatsOnlineIpListResponse\x12\x0c\n\x04name\x18\x01 \x01(\t\x12J\n\x03ips\x18\x02 \x03(\x0b\x32=.xray.app.stats.command.GetStatsOnlineIpListResponse.IpsEntry\x1a*\n\x08IpsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03:\x02\x38\x01\"\x1a\n\x18GetAllOnlineUsersRequest\"*\n\x19GetAllOnlineUsersResponse\x12\r\n\x05users\x18\x01 \x03(\t\"\x08\n\x06\x43onfig2\x96\x05\n\x0cStatsService\x12_\n\x08GetStats\x12\'.xray.app.stats.command.GetStatsRequest\x1a(.xray.app.stats.command.GetStatsResponse\"\x00\x12\x65\n\x0eGetStatsOnline\x12\'.xray.app.stats.command.GetStatsRequest\x1a(.xray.app.stats.command.GetStatsResponse\"\x00\x12\x65\n\nQueryStats\x12).xray.app.stats.command.QueryStatsRequest\x1a*.xray.app.stats.command.QueryStatsResponse\"\x00\x12\x62\n\x0bGetSysStats\x12\'.xray.app.stats.command.SysStatsRequest\x1a(.xray.app.stats.command.SysStatsResponse\"\x00\x12w\n\x14GetStatsOnlineIpList\x12\'.xray.app.stats.command.GetStatsRequest\x1a\x34.xray.app.stats.command.GetStatsOnlineIpListResponse\"\x00\x12z\n\x11GetAllOnlineUsers\x12\x30.xray.app.stats.command.GetAllOnlineUsersRequest\x1a\x31.xray.app.stats.command.GetAllOnlineUsersResponse\"\x00\x42-Z+github.com/xtls/xray-core/app/stats/commandb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'app.proto.stats_command_pb2', _globals)
+if _descriptor._USE_C_DESCRIPTORS == False:
+  DESCRIPTOR._options = None
+  DESCRIPTOR._serialized_options = b'Z+github.com/xtls/xray-core/app/stats/command'
+  _GETSTATSONLINEIPLISTRESPONSE_IPSENTRY._options = None
+  _GETSTATSONLINEIPLISTRESPONSE_IPSENTRY._serialized_options = b'8\001'
+  _globals['_GETSTATSREQUEST']._serialized_start=57
+  _globals['_GETSTATSREQUEST']._serialized_end=103
+  _globals['_STAT']._serialized_start=105
+  _globals['_STAT']._serialized_end=140
+  _globals['_GETSTATSRESPONSE']._serialized_start=142
+  _globals['_GETSTATSRESPONSE']._serialized_end=204
+  _globals['_QUERYSTATSREQUEST']._serialized_start=206
+  _globals['_QUERYSTATSREQUEST']._serialized_end=257
+  _globals['_QUERYSTATSRESPONSE']._serialized_start=259
+  _globals['_QUERYSTATSRESPONSE']._serialized_end=323
+  _globals['_SYSSTATSREQUEST']._serialized_start=325
+  _globals['_SYSSTATSREQUEST']._serialized_end=342
+  _globals['_SYSSTATSRESPONSE']._serialized_start=345
+  _globals['_SYSSTATSRESPONSE']._serialized_end=539
+  _globals['_GETSTATSONLINEIPLISTRESPONSE']._serialized_start=542
+  _globals['_GETSTATSONLINEIPLISTRESPONSE']._serialized_end=706
+  _globals['_GETSTATSONLINEIPLISTRESPONSE_IPSENTRY']._serialized_start=664
+  _globals['_GETSTATSONLINEIPLISTRESPONSE_IPSENTRY']._serialized_end=706
+  _globals['_GETALLONLINEUSERSREQUEST']._serialized_start=708
+  _globals['_GETALLONLINEUSERSREQUEST']._serialized_end=734
+  _globals['_GETALLONLINEUSERSRESPONSE']._serialized_start=736
+  _globals['_GETALLONLINEUSERSRESPONSE']._serialized_end=778
+  _globals['_CONFIG']._serialized_start=780
+  _globals['_CONFIG']._serialized_end=788
+  _globals['_STATSSERVICE']._serialized_start=791
+  _globals['_STATSSERVICE']._serialized_end=1453
+# @@protoc_insertion_point(module_scope)
@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from typing import List, Literal, Optional
 from app.database import get_db
-from app.models import User, Device, AccessLog
-from app.schemas import OnlineUser, MonitoringStats, DeviceResponse, AccessLogResponse
+from app.models import Device
+from app.schemas import OnlineUser, MonitoringStats, DeviceResponse, AccessLogResponse, ThroughputStats
+from app.services.stats_service import StatsService
+from app.services.usage_service import UsageService
+from app.services.throughput_service import throughput
+from app.services.access_log_service import AccessLogService
+from app.services.domain_stats_service import DomainStatsService
+from app.services.monitoring_feed import monitoring_feed
+from app.utils.serialization import dumps_compact
+from app.utils.pagination import decode_cursor, encode_cursor, iter_ndjson, keyset_before
 from app.routers.auth import get_current_admin
 from app.models import Admin
 from datetime import datetime, timedelta
@@ -16,166 +27,126 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/monitoring", tags=["Monitoring"])
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-    
-    async def broadcast(self, data: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(data)
-            except:
-                pass
-
-
-manager = ConnectionManager()
-
-
-@router.get("/online-users", response_model=List[OnlineUser])
+@router.get("/online-users", response_class=Response, responses={200: {"model": List[OnlineUser]}})
 async def get_online_users(
+    ips: bool = Query(False, description="Include source IPs (one Xray call per online user)"),
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
-    """Get list of online users"""
-    from app.services.stats_service import StatsService
+    """
+    Get list of online users
+    Without ips, served from the monitoring feed, which keeps the list
+    rebuilt every monitoring_feed_interval while it is being polled.
+    """
+    if not ips:
+        return Response(content=await monitoring_feed.online_users_body(), media_type="application/json")
     
-    try:
-        stats_service = StatsService(db)
-        online_user_uuids = stats_service.get_online_users()
-        
-        # Get users from database
-        online_users_list = []
-        if online_user_uuids:
-            users = db.query(User).filter(
-                User.uuid.in_(online_user_uuids),
-                User.is_active == True
-            ).all()
-            
-            for user in users:
-                # Get real-time stats
-                traffic = stats_service.get_user_traffic(user.uuid)
-                user.data_used = traffic.get('total', user.data_used)
-                
-                # Get devices
-                devices = db.query(Device).filter(Device.user_id == user.id).all()
-                last_seen = datetime.utcnow()  # Approximate from stats
-                if devices:
-                    last_seen = max([d.last_seen for d in devices], default=datetime.utcnow())
-                
-                online_users_list.append(OnlineUser(
-                    user_id=user.id,
-                    username=user.username,
-                    uuid=user.uuid,
-                    data_used=user.data_used,
-                    data_limit=user.data_limit,
-                    last_seen=last_seen,
-                    devices=[DeviceResponse(
-                        id=d.id,
-                        fingerprint=d.fingerprint,
-                        user_agent=d.user_agent,
-                        last_seen=d.last_seen,
-                        created_at=d.created_at
-                    ) for d in devices]
-                ))
-        
-        stats_service.close()
-        return online_users_list
-    except Exception as e:
-        logger.error(f"Error getting online users: {e}")
-        # Fallback to device-based method
-        cutoff_time = datetime.utcnow() - timedelta(minutes=5)
-        online_users_list = []
-        users = db.query(User).filter(User.is_active == True).all()
-        
-        for user in users:
-            recent_device = db.query(Device).filter(
-                Device.user_id == user.id,
-                Device.last_seen >= cutoff_time
-            ).first()
-            
-            if recent_device:
-                devices = db.query(Device).filter(Device.user_id == user.id).all()
-                online_users_list.append(OnlineUser(
-                    user_id=user.id,
-                    username=user.username,
-                    uuid=user.uuid,
-                    data_used=user.data_used,
-                    data_limit=user.data_limit,
-                    last_seen=recent_device.last_seen,
-                    devices=[DeviceResponse(
-                        id=d.id,
-                        fingerprint=d.fingerprint,
-                        user_agent=d.user_agent,
-                        last_seen=d.last_seen,
-                        created_at=d.created_at
-                    ) for d in devices]
-                ))
-        
-        return online_users_list
-
-
-@router.get("/stats", response_model=MonitoringStats)
+    # Already in OnlineUser form; serialized directly instead of validated again
+    online_users = await StatsService(db).list_online_users(ips, unsynced=throughput.unsynced())
+    return Response(content=dumps_compact(online_users), media_type="application/json")
+
+
+@router.get("/stats", response_class=Response, responses={200: {"model": MonitoringStats}})
 async def get_monitoring_stats(
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
     """Get monitoring statistics"""
-    online_users = await get_online_users(db, admin)
+    online_users = await StatsService(db).list_online_users()
     
-    # Calculate 24h traffic
+    # Calculate 24h traffic from the per-user traffic buckets
     cutoff_time = datetime.utcnow() - timedelta(hours=24)
-    result = db.query(
-        db.func.sum(AccessLog.bytes_sent + AccessLog.bytes_received).label("total")
-    ).filter(AccessLog.timestamp >= cutoff_time).first()
-    
-    total_traffic_24h = result.total or 0
+    total_traffic_24h = await run_in_threadpool(UsageService(db).total_bytes, cutoff_time)
     
-    return MonitoringStats(
-        online_users=online_users,
-        total_online=len(online_users),
-        total_traffic_24h=total_traffic_24h
-    )
+    return Response(content=dumps_compact({
+        "online_users": online_users,
+        "total_online": len(online_users),
+        "total_traffic_24h": total_traffic_24h,
+    }), media_type="application/json")
+
+
+@router.get("/throughput", response_model=ThroughputStats)
+async def get_throughput(
+    top: int = Query(10, ge=1, le=1000),
+    admin: Admin = Depends(get_current_admin)
+):
+    """Get live bytes/sec (current and peak) and the top talkers from the in-memory sampler"""
+    return throughput.snapshot(top)
+
+
+def _parse_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def _set_next_cursor(response: Response, page: List[dict], limit: int, timestamp_key: str):
+    # A full page may have more after it
+    if page and len(page) == limit:
+        last = page[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last[timestamp_key], last["id"])
 
 
 @router.get("/devices", response_model=List[DeviceResponse])
 async def get_devices(
+    response: Response,
     user_id: str = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    output_format: Literal["json", "ndjson"] = Query("json", alias="format", description="ndjson streams every device"),
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
-    """Get device fingerprints"""
-    query = db.query(Device)
+    """
+    Get device fingerprints, most recently seen first, a page at a time
+    (the next page's cursor is in the X-Next-Cursor header)
+    """
+    query = select(Device.id, Device.fingerprint, Device.user_agent, Device.last_seen, Device.created_at)
     if user_id:
-        query = query.filter(Device.user_id == user_id)
+        query = query.where(Device.user_id == user_id)
+    before = _parse_cursor(cursor)
+    if before:
+        query = query.where(keyset_before(Device.last_seen, Device.id, before))
+    query = query.order_by(Device.last_seen.desc(), Device.id.desc())
+    
+    if output_format == "ndjson":
+        return StreamingResponse(iter_ndjson(query), media_type="application/x-ndjson")
     
-    devices = query.order_by(Device.last_seen.desc()).all()
+    devices = [dict(row._mapping) for row in db.execute(query.limit(limit))]
+    _set_next_cursor(response, devices, limit, "last_seen")
     return devices
 
 
 @router.get("/access-logs", response_model=List[AccessLogResponse])
 async def get_access_logs(
+    response: Response,
     user_id: str = None,
-    domain: str = None,
-    limit: int = 100,
+    domain: Optional[str] = Query(None, description="Substring, or *.example.com for a domain and its subdomains"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    output_format: Literal["json", "ndjson"] = Query("json", alias="format", description="ndjson streams every match"),
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
-    """Get access logs (SNI logging)"""
-    query = db.query(AccessLog)
-    
-    if user_id:
-        query = query.filter(AccessLog.user_id == user_id)
-    if domain:
-        query = query.filter(AccessLog.domain.contains(domain))
+    """
+    Get access logs (SNI logging), newest first, a page at a time (the next
+    page's cursor is in the X-Next-Cursor header)
+    """
+    service = AccessLogService(db)
+    before = _parse_cursor(cursor)
+    if output_format == "ndjson":
+        query = service.export_query(user_id, domain, before)
+        return StreamingResponse(iter_ndjson(query) if query is not None else iter(()),
+                                 media_type="application/x-ndjson")
     
-    logs = query.order_by(AccessLog.timestamp.desc()).limit(limit).all()
+    logs = service.recent(user_id, domain, limit, before)
+    _set_next_cursor(response, logs, limit, "timestamp")
     return logs
 
 
@@ -186,45 +157,52 @@ async def get_top_domains(
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
-    """Get top visited domains"""
+    """Get top visited domains (from the hourly domain aggregates)"""
     cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-    
-    result = db.query(
-        AccessLog.domain,
-        db.func.count(AccessLog.id).label("count"),
-        db.func.sum(AccessLog.bytes_sent + AccessLog.bytes_received).label("traffic")
-    ).filter(
-        AccessLog.timestamp >= cutoff_time,
-        AccessLog.domain.isnot(None)
-    ).group_by(AccessLog.domain).order_by(
-        db.func.count(AccessLog.id).desc()
-    ).limit(limit).all()
-    
-    return [
-        {
-            "domain": r.domain,
-            "visits": r.count,
-            "traffic": r.traffic or 0
-        }
-        for r in result
-    ]
+    return DomainStatsService(db).top_domains(cutoff_time, limit)
+
+
+async def _send_frames(websocket: WebSocket, queue: asyncio.Queue):
+    while True:
+        await websocket.send_text(await queue.get())
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time monitoring"""
-    await manager.connect(websocket)
+    """
+    WebSocket endpoint for real-time monitoring
+    Frames come from the shared monitoring feed, built once per tick for all
+    connections: a "snapshot" with all online users first, then a "delta"
+    per tick with the changed OnlineUser entries and removed user IDs. Each
+    frame has a seq; a client that sees a gap (seq not previous + 1) sends
+    {"type": "resync"} and gets a fresh snapshot.
+    """
+    # The session cookie is enough: no DB query per connection
+    if not websocket.session.get("admin_id"):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    queue = monitoring_feed.subscribe()
+    sender = asyncio.create_task(_send_frames(websocket, queue))
     try:
         while True:
-            # Send updates every 5 seconds
-            await asyncio.sleep(5)
-            
-            # Get fresh data (would need db session in production)
-            # For now, send heartbeat
-            await websocket.send_json({
-                "type": "heartbeat",
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                request = json.loads(message.get("text") or "null")
+            except ValueError:
+                continue
+            if isinstance(request, dict) and request.get("type") == "resync":
+                monitoring_feed.resync(queue)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-
+        pass
+    finally:
+        monitoring_feed.unsubscribe(queue)
+        sender.cancel()
+        try:
+            await sender
+        except (asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+            # Cancelled here, or already ended by a send on the closed socket
+            pass
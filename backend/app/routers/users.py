@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.database import get_db
 from app.models import User
-from app.schemas import UserCreate, UserUpdate, UserResponse, UserStats
+from app.schemas import (
+    UserCreate, UserUpdate, UserResponse, UserStats, UsagePoint, UserUsage,
+    BulkImportRow, BulkImportResponse, BulkUserUpdate, BulkUpdateResponse
+)
 from app.routers.auth import get_current_admin
 from app.models import Admin
-from app.services.xray_service import XrayService
+from app.services.xray_service import XrayService, build_client_config
 from app.services.reality_service import RealityService
 from app.services.routing_service import RoutingService
-from datetime import datetime
+from app.services.config_writer import config_writer
+from app.services.bulk_user_service import (
+    BulkUserService, IMPORT_CHUNK_SIZE, detect_import_format, iter_import_records
+)
+from app.services.usage_service import UsageService, MAX_POINTS, MINUTE, from_epoch, to_naive_utc
+from app.services.access_log_service import AccessLogService
+from datetime import datetime, timedelta
 import uuid
 import logging
 
@@ -17,6 +28,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
+# Above this many client changes, rewrite the config and restart Xray once
+# instead of sending one HandlerService call per client
+LIVE_UPDATE_LIMIT = 500
+
 
 def get_services(db: Session):
     """Get service instances"""
@@ -26,6 +41,33 @@ def get_services(db: Session):
     return xray_service, reality_service
 
 
+async def apply_xray_client_changes(
+    db: Session,
+    added: List[str] = None,
+    removed: List[str] = None,
+    wait: bool = False
+):
+    """
+    Push client changes (user UUIDs) to the running Xray and keep the config
+    file in sync. The live update avoids a restart; the file rewrite is
+    coalesced by the config writer and only restarts Xray if the live update
+    failed or the change is too large to push one client at a time.
+    """
+    added = added or []
+    removed = removed or []
+    if len(added) + len(removed) > LIVE_UPDATE_LIMIT:
+        live = False
+    else:
+        xray_service, _ = get_services(db)
+        live = await xray_service.apply_client_changes(
+            added=[build_client_config(user_uuid) for user_uuid in added],
+            removed=removed
+        )
+    applied = config_writer.mark_dirty(reload=not live)
+    if wait:
+        await applied
+
+
 @router.get("/", response_model=List[UserResponse])
 async def get_users(
     skip: int = Query(0, ge=0),
@@ -58,9 +100,8 @@ async def get_user_stats(
     # Get online users from Xray stats
     try:
         stats_service = StatsService(db)
-        online_user_uuids = stats_service.get_online_users()
+        online_user_uuids = await stats_service.get_online_users()
         online_users = len(online_user_uuids) if online_user_uuids else 0
-        stats_service.close()
     except Exception as e:
         logger.error(f"Error getting online users count: {e}")
         online_users = 0
@@ -99,9 +140,73 @@ async def get_user(
     return user
 
 
+@router.get("/{user_id}/usage", response_model=UserUsage)
+async def get_user_usage(
+    user_id: str,
+    start: Optional[datetime] = Query(None, alias="from", description="Defaults to 24 hours before to"),
+    end: Optional[datetime] = Query(None, alias="to", description="Defaults to now"),
+    step: Optional[int] = Query(None, ge=MINUTE, description="Seconds per point, a multiple of 60; picked from the range if omitted"),
+    db: Session = Depends(get_db),
+    admin: Admin = Depends(get_current_admin)
+):
+    """Get user traffic over time from the minute/hour/day rollups"""
+    if not db.query(User.id).filter(User.id == user_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    end = to_naive_utc(end) if end else datetime.utcnow()
+    start = to_naive_utc(start) if start else end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from must be before to"
+        )
+    
+    usage_service = UsageService(db)
+    if step is None:
+        step = usage_service.pick_step(start, end)
+    if step % MINUTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="step must be a multiple of 60 seconds"
+        )
+    if (end - start).total_seconds() > step * MAX_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too large for step, at most {MAX_POINTS} points"
+        )
+    
+    try:
+        rows = usage_service.query(user_id, start, end, step)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    points = [
+        UsagePoint(timestamp=from_epoch(ts), uplink=uplink, downlink=downlink, total=uplink + downlink)
+        for ts, uplink, downlink in rows
+    ]
+    uplink = sum(point.uplink for point in points)
+    downlink = sum(point.downlink for point in points)
+    return UserUsage(
+        user_id=user_id,
+        start=start,
+        end=end,
+        step=step,
+        uplink=uplink,
+        downlink=downlink,
+        total=uplink + downlink,
+        points=points
+    )
+
+
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate,
+    wait: bool = Query(False, description="Wait until the Xray config file is rewritten"),
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
@@ -129,18 +234,116 @@ async def create_user(
     db.refresh(user)
     
     # Update Xray config
-    xray_service, _ = get_services(db)
-    users = db.query(User).filter(User.is_active == True).all()
-    config = xray_service.generate_config(users)
-    xray_service.save_config(config)
+    if user.is_active:
+        await apply_xray_client_changes(db, added=[user.uuid], wait=wait)
     
     return user
 
 
+@router.post("/bulk", response_model=BulkImportResponse)
+async def bulk_import_users(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$", description="Body format, detected from Content-Type if omitted"),
+    wait: bool = Query(False, description="Wait until the Xray config file is rewritten"),
+    db: Session = Depends(get_db),
+    admin: Admin = Depends(get_current_admin)
+):
+    """
+    Bulk import users from a streamed CSV (with header) or JSONL body.
+    Rows are validated as UserCreate and inserted in chunks; Xray is updated
+    once at the end. Returns a per-row report.
+    """
+    fmt = format or detect_import_format(request.headers.get("content-type"))
+    service = BulkUserService(db)
+    results = []
+    chunk = []
+    
+    async for row_number, record, error in iter_import_records(request.stream(), fmt):
+        if error is None:
+            try:
+                chunk.append((row_number, UserCreate.model_validate(record)))
+            except ValidationError as e:
+                error = "; ".join(
+                    f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+                )
+        if error is not None:
+            username = (record or {}).get("username")
+            results.append(BulkImportRow(
+                row=row_number,
+                username=str(username) if username is not None else None,
+                status="error",
+                error=error
+            ))
+        
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            results.extend(await run_in_threadpool(service.insert_chunk, chunk))
+            chunk = []
+    
+    if chunk:
+        results.extend(await run_in_threadpool(service.insert_chunk, chunk))
+    results.sort(key=lambda result: result.row)
+    
+    # Update Xray config
+    if service.created_active_uuids:
+        await apply_xray_client_changes(db, added=service.created_active_uuids, wait=wait)
+    
+    created = sum(1 for result in results if result.status == "created")
+    logger.info(f"Bulk import: {created} created, {len(results) - created} failed")
+    return BulkImportResponse(
+        total=len(results),
+        created=created,
+        failed=len(results) - created,
+        results=results
+    )
+
+
+@router.post("/bulk/update", response_model=BulkUpdateResponse)
+async def bulk_update_users(
+    request: BulkUserUpdate,
+    wait: bool = Query(False, description="Wait until the Xray config file is rewritten"),
+    db: Session = Depends(get_db),
+    admin: Admin = Depends(get_current_admin)
+):
+    """
+    Update all users matching a filter with a single UPDATE statement:
+    extend expire_date, set data_limit, toggle is_active or reset data_used.
+    """
+    if not request.filter.model_dump(exclude_none=True):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one filter is required"
+        )
+    if not (request.extend_days or request.data_limit is not None
+            or request.is_active is not None or request.reset_data_used):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No changes requested"
+        )
+    
+    if request.reset_data_used:
+        # Move traffic counted so far into data_used before it is zeroed, so a
+        # later sync does not add pre-reset traffic back
+        from app.services.stats_service import StatsService
+        await StatsService(db).sync_all_users_stats()
+    
+    service = BulkUserService(db)
+    user_ids, flipped = await run_in_threadpool(service.update_by_filter, request)
+    
+    # Update Xray config (one client-set update for all activation changes)
+    if flipped:
+        if request.is_active:
+            await apply_xray_client_changes(db, added=flipped, wait=wait)
+        else:
+            await apply_xray_client_changes(db, removed=flipped, wait=wait)
+    
+    return BulkUpdateResponse(matched=len(user_ids), user_ids=user_ids)
+
+
 @router.put("/{user_id}", response_model=UserResponse)
 async def update_user(
     user_id: str,
     user_data: UserUpdate,
+    wait: bool = Query(False, description="Wait until the Xray config file is rewritten"),
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
@@ -152,6 +355,8 @@ async def update_user(
             detail="User not found"
         )
     
+    was_active = user.is_active
+    
     # Update fields
     if user_data.username is not None:
         # Check if new username exists
@@ -179,11 +384,11 @@ async def update_user(
     db.commit()
     db.refresh(user)
     
-    # Update Xray config
-    xray_service, _ = get_services(db)
-    users = db.query(User).filter(User.is_active == True).all()
-    config = xray_service.generate_config(users)
-    xray_service.save_config(config)
+    # Update Xray config (only activation changes affect the client list)
+    if user.is_active and not was_active:
+        await apply_xray_client_changes(db, added=[user.uuid], wait=wait)
+    elif was_active and not user.is_active:
+        await apply_xray_client_changes(db, removed=[user.uuid], wait=wait)
     
     return user
 
@@ -191,6 +396,7 @@ async def update_user(
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: str,
+    wait: bool = Query(False, description="Wait until the Xray config file is rewritten"),
     db: Session = Depends(get_db),
     admin: Admin = Depends(get_current_admin)
 ):
@@ -202,14 +408,17 @@ async def delete_user(
             detail="User not found"
         )
     
+    was_active = user.is_active
+    user_uuid = user.uuid
+    
     db.delete(user)
+    UsageService(db).delete_user(user_id)
+    AccessLogService(db).delete_user(user_id)
     db.commit()
     
     # Update Xray config
-    xray_service, _ = get_services(db)
-    users = db.query(User).filter(User.is_active == True).all()
-    config = xray_service.generate_config(users)
-    xray_service.save_config(config)
+    if was_active:
+        await apply_xray_client_changes(db, removed=[user_uuid], wait=wait)
     
     return None
 
@@ -228,8 +437,14 @@ async def reset_user_data(
             detail="User not found"
         )
     
-    user.data_used = 0
-    db.commit()
+    # Reset the Xray counters too, or the next stats sync would add the
+    # traffic counted before the reset back on top
+    from app.services.stats_service import StatsService
+    if not await StatsService(db).reset_user_stats(user.uuid):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reset user data"
+        )
     db.refresh(user)
     
     return user
@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import XrayConfig, User
+from app.models import XrayConfig
 from app.schemas import XrayConfigResponse, XrayConfigUpdate
 from app.routers.auth import get_current_admin
 from app.models import Admin
 from app.services.reality_service import RealityService
 from app.services.routing_service import RoutingService
 from app.services.xray_service import XrayService
+from app.services.config_writer import config_writer
 
 router = APIRouter(prefix="/xray", tags=["Xray"])
 
@@ -50,11 +51,8 @@ async def rotate_reality_settings(
     reality_service = RealityService(db)
     config = reality_service.rotate_reality_settings()
     
-    # Regenerate Xray config
-    xray_service, _ = get_services(db)
-    users = db.query(User).filter(User.is_active == True).all()
-    xray_config = xray_service.generate_config(users)
-    xray_service.save_config(xray_config)
+    # Regenerate Xray config (new Reality keys need a restart)
+    await config_writer.mark_dirty(reload=True)
     
     return {"message": "Reality settings rotated successfully", "config": XrayConfigResponse(
         id=config.id,
@@ -88,11 +86,9 @@ async def update_xray_config(
     
     config = reality_service.get_or_create_config()
     
-    # Regenerate Xray config
-    xray_service, _ = get_services(db)
-    users = db.query(User).filter(User.is_active == True).all()
-    xray_config = xray_service.generate_config(users)
-    xray_service.save_config(xray_config)
+    # Regenerate Xray config (Reality changes need a restart)
+    reality_changed = bool(config_update.reality_dest or config_update.reality_server_names)
+    await config_writer.mark_dirty(reload=reality_changed)
     
     return XrayConfigResponse(
         id=config.id,
@@ -131,22 +127,19 @@ async def get_xray_status(
 ):
     """Get Xray service status"""
     try:
-        from app.services.xray_grpc_client import XrayGRPCClient
-        client = XrayGRPCClient()
+        from app.services.xray_grpc_client import xray_grpc
         
         status = {
-            "connected": client.channel is not None,
-            "address": client.address,
+            "connected": await xray_grpc.get_sys_stats() is not None,
+            "channel_state": xray_grpc.state,
+            "address": xray_grpc.address,
             "config_exists": False
         }
         
         # Check if config file exists
-        from pathlib import Path
-        from app.config import settings
-        config_path = Path(settings.xray_config_path)
-        status["config_exists"] = config_path.exists()
+        xray_service, _ = get_services(db)
+        status["config_exists"] = xray_service.config_exists()
         
-        client.close()
         return status
     except Exception as e:
         raise HTTPException(
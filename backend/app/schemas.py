@@ -28,6 +28,7 @@ class UserResponse(UserBase):
     id: str
     uuid: str
     data_used: int
+    last_active_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     
@@ -35,6 +36,24 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UsagePoint(BaseModel):
+    timestamp: datetime  # Start of the point (UTC)
+    uplink: int
+    downlink: int
+    total: int
+
+
+class UserUsage(BaseModel):
+    user_id: str
+    start: datetime
+    end: datetime
+    step: int  # Seconds per point
+    uplink: int
+    downlink: int
+    total: int
+    points: List[UsagePoint]
+
+
 class UserStats(BaseModel):
     total_users: int
     active_users: int
@@ -57,7 +76,7 @@ class DeviceResponse(BaseModel):
 
 # Access Log Schemas
 class AccessLogResponse(BaseModel):
-    id: str
+    id: int
     user_id: str
     domain: Optional[str]
     bytes_sent: int
@@ -99,6 +118,7 @@ class OnlineUser(BaseModel):
     data_limit: int
     last_seen: datetime
     devices: List[DeviceResponse]
+    ips: List[str] = []  # Source IPs of live connections (Xray online stats)
 
 
 class MonitoringStats(BaseModel):
@@ -107,6 +127,21 @@ class MonitoringStats(BaseModel):
     total_traffic_24h: int
 
 
+class UserThroughput(BaseModel):
+    uuid: str
+    current_bps: float  # Bytes/sec (uplink + downlink) over the latest sample
+    peak_bps: float  # Highest sample rate in the window
+
+
+class ThroughputStats(BaseModel):
+    interval: float  # Seconds between samples
+    window: float  # Seconds covered by the samples
+    active_users: int  # Users with traffic in the window
+    current_bps: float
+    peak_bps: float
+    top_users: List[UserThroughput]
+
+
 # Subscription Schemas
 class SubscriptionResponse(BaseModel):
     v2rayng: str
@@ -135,3 +170,40 @@ class XrayConfigUpdate(BaseModel):
     reality_server_names: Optional[List[str]] = None
     server_ip: Optional[str] = None
 
+
+
+# Bulk User Schemas
+class BulkImportRow(BaseModel):
+    row: int  # 1-based data row (CSV header not counted)
+    username: Optional[str] = None
+    status: str  # created / error
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkImportResponse(BaseModel):
+    total: int
+    created: int
+    failed: int
+    results: List[BulkImportRow]
+
+
+class BulkUserFilter(BaseModel):
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    username_prefix: Optional[str] = None
+    is_active: Optional[bool] = None
+    expired: Optional[bool] = None  # expire_date in the past (True) or not (False)
+
+
+class BulkUserUpdate(BaseModel):
+    filter: BulkUserFilter
+    extend_days: Optional[int] = None  # Added to expire_date; users without one stay unlimited
+    data_limit: Optional[int] = None
+    is_active: Optional[bool] = None
+    reset_data_used: bool = False
+
+
+class BulkUpdateResponse(BaseModel):
+    matched: int
+    user_ids: List[str]
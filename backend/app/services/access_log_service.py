@@ -0,0 +1,221 @@
+"""
+Compact access log storage
+access_logs rows hold integers only: the user through the user_keys
+surrogate table and the domain through the domains dictionary.
+AccessLogWriter keeps both mappings in memory while ingesting, and
+AccessLogService joins them back for the API.
+"""
+import heapq
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, column, delete, insert, inspect, or_, select, table, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.database import dialect_insert
+from app.models import AccessLog, Domain, User, UserKey
+from app.services.domain_stats_service import DomainStatsService
+from app.utils.access_log import reverse_labels
+from app.utils.pagination import keyset_before
+import logging
+
+logger = logging.getLogger(__name__)
+
+DOMAIN_CACHE_SIZE = 200_000  # Cached domain IDs; the cache starts over past this
+LOOKUP_CHUNK = 500  # Names per IN (...) lookup
+PER_DOMAIN_SEEKS = 32  # Domain filters matching more dictionary entries walk the timestamp index
+
+# FTS5 trigram index over domains.name (created by init_db on SQLite)
+domains_fts = table("domains_fts", column("rowid"))
+_domain_fts: Optional[bool] = None  # Whether domains_fts exists, checked once per process
+
+
+class AccessLogWriter:
+    """
+    Insert access logs, mapping client emails (user UUIDs) to user keys and
+    domains to dictionary IDs from in-memory caches.
+    Keys and IDs are created in the caller's transaction; call invalidate()
+    after a rollback so rolled back IDs are not reused.
+    """
+    
+    def __init__(self, min_reload_interval: float = 30.0, domain_cache_size: int = DOMAIN_CACHE_SIZE):
+        self.min_reload_interval = min_reload_interval
+        self.domain_cache_size = domain_cache_size
+        self._user_keys: Dict[str, int] = {}
+        self._users_loaded_at = None
+        self._domain_ids: Dict[str, int] = {}
+    
+    def invalidate(self):
+        self._user_keys = {}
+        self._users_loaded_at = None
+        self._domain_ids = {}
+    
+    def user_key(self, db: Session, email: str) -> Optional[int]:
+        """User key for a client email; on a miss all keys are reloaded in one query"""
+        key = self._user_keys.get(email)
+        if key is None and (
+            self._users_loaded_at is None or time.monotonic() - self._users_loaded_at > self.min_reload_interval
+        ):
+            self._user_keys = self._load_user_keys(db)
+            self._users_loaded_at = time.monotonic()
+            key = self._user_keys.get(email)
+        return key
+    
+    def _load_user_keys(self, db: Session) -> Dict[str, int]:
+        # Give users created since the last load a key first
+        stmt = dialect_insert(db, UserKey.__table__).from_select(
+            ["user_id"], select(User.id).where(User.id.not_in(select(UserKey.user_id)))
+        )
+        db.execute(stmt.on_conflict_do_nothing())
+        return dict(db.execute(select(User.uuid, UserKey.id).join(UserKey, UserKey.user_id == User.id)).all())
+    
+    def domain_ids(self, db: Session, names: Set[str]) -> Dict[str, int]:
+        """Dictionary IDs for domain names, adding the names not seen before"""
+        cache = self._domain_ids
+        missing = {name for name in names if name not in cache}
+        if not missing:
+            return cache
+        if len(cache) + len(missing) > self.domain_cache_size:
+            cache.clear()
+            missing = names
+        
+        stmt = dialect_insert(db, Domain.__table__).on_conflict_do_nothing()
+        db.execute(stmt, [{"name": name, "reversed_name": reverse_labels(name)} for name in missing])
+        missing = list(missing)
+        for start in range(0, len(missing), LOOKUP_CHUNK):
+            cache.update(db.execute(
+                select(Domain.name, Domain.id).where(Domain.name.in_(missing[start:start + LOOKUP_CHUNK]))
+            ).all())
+        return cache
+    
+    def write(self, db: Session, records: List[Tuple[datetime, int, str]]) -> int:
+        """
+        Insert (timestamp, user key, domain) records with one executemany and
+        add them to the hourly domain aggregates. Does not commit.
+        """
+        if not records:
+            return 0
+        ids = self.domain_ids(db, {domain for _, _, domain in records if domain})
+        DomainStatsService(db).record((timestamp, domain, 0) for timestamp, _, domain in records)
+        db.execute(insert(AccessLog.__table__), [
+            {"user_key": user_key, "domain_id": ids.get(domain), "timestamp": timestamp}
+            for timestamp, user_key, domain in records
+        ])
+        return len(records)
+
+
+class AccessLogService:
+    """Read and delete access logs in the compact schema"""
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def recent(
+        self, user_id: str = None, domain: str = None, limit: int = 100,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> List[Dict]:
+        """
+        Newest access logs as AccessLogResponse dicts, optionally for one user
+        or matching a domain, continuing after the (timestamp, id) key `before`
+        """
+        query = self._query(user_id, domain, before, limit)
+        if query is None:
+            return []
+        rows = self.db.execute(query.limit(limit)).all()
+        return [dict(row._mapping) for row in rows]
+    
+    def export_query(
+        self, user_id: str = None, domain: str = None, before: Optional[Tuple[datetime, int]] = None
+    ) -> Optional[Select]:
+        """All rows recent() would page through, newest first; None if nothing can match"""
+        return self._query(user_id, domain, before)
+    
+    def _query(
+        self, user_id: Optional[str], domain: Optional[str], before: Optional[Tuple[datetime, int]],
+        limit: int = None
+    ) -> Optional[Select]:
+        query = (
+            select(
+                AccessLog.id,
+                UserKey.user_id,
+                Domain.name.label("domain"),
+                AccessLog.bytes_sent,
+                AccessLog.bytes_received,
+                AccessLog.timestamp,
+            )
+            .join(UserKey, UserKey.id == AccessLog.user_key)
+            .outerjoin(Domain, Domain.id == AccessLog.domain_id)
+        )
+        if user_id:
+            user_key = self.db.scalar(select(UserKey.id).where(UserKey.user_id == user_id))
+            if user_key is None:
+                return None
+            query = query.where(AccessLog.user_key == user_key)
+        if domain:
+            # Searches the dictionary, not every log row
+            matches = self.domain_matches(domain)
+            domain_ids = self.db.scalars(matches.limit(PER_DOMAIN_SEEKS + 1)).all()
+            if not domain_ids:
+                return None
+            if limit is None or user_id or len(domain_ids) > PER_DOMAIN_SEEKS:
+                # Walk the user's (or the timestamp) index newest first; "+ 0"
+                # keeps the planner from fetching and sorting every match instead
+                query = query.where((AccessLog.domain_id + 0).in_(matches))
+            else:
+                query = query.where(AccessLog.id.in_(self._newest_ids(domain_ids, limit, before)))
+        if before:
+            query = query.where(keyset_before(AccessLog.timestamp, AccessLog.id, before))
+        
+        # Ties on the second-resolution timestamp are broken by id, which the
+        # SQLite indexes already end with (rowid)
+        return query.order_by(AccessLog.timestamp.desc(), AccessLog.id.desc())
+    
+    def domain_matches(self, domain: str) -> Select:
+        """
+        Dictionary IDs matching a domain search, through the index that fits
+        the query form:
+        - "*.example.com" or ".example.com": example.com and its subdomains,
+          a range scan on reversed_name
+        - anything else: names containing it, through the domains_fts trigram
+          index (3+ characters, SQLite), otherwise a scan of the dictionary
+        """
+        domain = domain.lower()
+        suffix = domain.lstrip("*.")
+        if suffix and domain != suffix:
+            reversed_suffix = reverse_labels(suffix)
+            # "/" sorts right after ".": the range holds exactly the names below the suffix
+            return select(Domain.id).where(or_(
+                Domain.reversed_name == reversed_suffix,
+                and_(Domain.reversed_name >= reversed_suffix + ".", Domain.reversed_name < reversed_suffix + "/"),
+            ))
+        if len(domain) >= 3 and self._has_domain_fts():
+            phrase = '"' + domain.replace('"', '""') + '"'
+            return select(domains_fts.c.rowid).where(text("domains_fts MATCH :phrase").bindparams(phrase=phrase))
+        return select(Domain.id).where(Domain.name.contains(domain, autoescape=True))
+    
+    def _has_domain_fts(self) -> bool:
+        global _domain_fts
+        if _domain_fts is None:
+            _domain_fts = inspect(self.db.get_bind()).has_table("domains_fts")
+        return _domain_fts
+    
+    def _newest_ids(
+        self, domain_ids: List[int], limit: int, before: Optional[Tuple[datetime, int]]
+    ) -> List[int]:
+        """IDs of the newest rows across a few domains, from one (domain_id, timestamp) seek each"""
+        candidates = []
+        for domain_id in domain_ids:
+            query = select(AccessLog.timestamp, AccessLog.id).where(AccessLog.domain_id == domain_id)
+            if before:
+                query = query.where(keyset_before(AccessLog.timestamp, AccessLog.id, before))
+            # Plain tuples compare much faster than Rows
+            candidates.extend(map(tuple, self.db.execute(
+                query.order_by(AccessLog.timestamp.desc(), AccessLog.id.desc()).limit(limit)
+            )))
+        return [row_id for _, row_id in heapq.nlargest(limit, candidates)]
+    
+    def delete_user(self, user_id: str):
+        """Drop a user's access logs and key (does not commit)"""
+        keys = select(UserKey.id).where(UserKey.user_id == user_id)
+        self.db.execute(delete(AccessLog).where(AccessLog.user_key.in_(keys)))
+        self.db.execute(delete(UserKey).where(UserKey.user_id == user_id))
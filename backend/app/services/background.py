@@ -0,0 +1,45 @@
+"""
+Background services
+Module-level singletons that run one asyncio task for the app's lifetime:
+main.py starts them on startup and stops them on shutdown.
+"""
+import asyncio
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundService:
+    """One task running _run() between start() and stop()"""
+    
+    name = "Background service"  # Used in the started/stopped log lines
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the task on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"{self.name} started")
+    
+    async def stop(self):
+        """Cancel the task and wait for it, then run _on_stop"""
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._on_stop()
+        logger.info(f"{self.name} stopped")
+    
+    async def _run(self):
+        raise NotImplementedError
+    
+    async def _on_stop(self):
+        """Cleanup after the task has ended"""
@@ -0,0 +1,242 @@
+"""
+Bulk user operations
+Streaming CSV/JSONL import with set-based validation and chunked inserts,
+and set-based updates of users matching a filter
+"""
+import codecs
+import csv
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import User
+from app.schemas import UserCreate, BulkImportRow, BulkUserFilter, BulkUserUpdate
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 5000
+
+JSONL_CONTENT_TYPES = (
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+    "application/x-jsonlines",
+    "application/json",
+)
+
+
+def detect_import_format(content_type: Optional[str]) -> str:
+    """Pick csv/jsonl from a Content-Type header (defaults to csv)"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return "jsonl" if media_type in JSONL_CONTENT_TYPES else "csv"
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines without buffering the whole body"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in stream:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_import_records(
+    stream: AsyncIterator[bytes],
+    fmt: str
+) -> AsyncIterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Parse an import body incrementally.
+    Yields (row number, record, parse error) for each non-empty data line.
+    CSV needs a header line; empty CSV cells are treated as missing.
+    """
+    header = None
+    row_number = 0
+    async for line in iter_lines(stream):
+        if not line.strip():
+            continue
+        
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            row_number += 1
+            if len(values) != len(header):
+                yield row_number, None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield row_number, {name: value for name, value in zip(header, values) if value != ""}, None
+        else:
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, None, "Expected a JSON object"
+                continue
+            yield row_number, record, None
+
+
+class BulkUserService:
+    """Insert validated users in chunks, checking collisions with one query per chunk"""
+    
+    def __init__(self, db: Session):
+        self.db = db
+        self.created_active_uuids: List[str] = []
+        # Usernames/emails created earlier in this import
+        self._seen_usernames = set()
+        self._seen_emails = set()
+    
+    def insert_chunk(self, chunk: List[Tuple[int, UserCreate]]) -> List[BulkImportRow]:
+        """Insert one chunk of (row number, user) in a single transaction"""
+        usernames = [user.username for _, user in chunk]
+        emails = [user.email for _, user in chunk if user.email]
+        taken_usernames = set(self.db.scalars(
+            select(User.username).where(User.username.in_(usernames))
+        ))
+        taken_emails = set(self.db.scalars(
+            select(User.email).where(User.email.in_(emails))
+        )) if emails else set()
+        
+        now = datetime.utcnow()
+        results = []
+        rows = []
+        for row_number, user in chunk:
+            # Earlier rows of this import count as taken too
+            if user.username in taken_usernames or user.username in self._seen_usernames:
+                error = "Username already exists"
+            elif user.email and (user.email in taken_emails or user.email in self._seen_emails):
+                error = "Email already exists"
+            else:
+                error = None
+            
+            if error:
+                results.append(BulkImportRow(row=row_number, username=user.username, status="error", error=error))
+                continue
+            
+            taken_usernames.add(user.username)
+            if user.email:
+                taken_emails.add(user.email)
+            values = {
+                "id": str(uuid.uuid4()),
+                "uuid": str(uuid.uuid4()),
+                "username": user.username,
+                "email": user.email,
+                "data_limit": user.data_limit,
+                "data_used": 0,
+                "expire_date": user.expire_date,
+                "is_active": user.is_active,
+                "created_at": now,
+                "updated_at": now,
+            }
+            rows.append(values)
+            results.append(BulkImportRow(row=row_number, username=user.username, status="created", id=values["id"]))
+        
+        if not rows:
+            return results
+        
+        try:
+            self.db.execute(insert(User.__table__), rows)
+            self.db.commit()
+        except IntegrityError as e:
+            # Lost a race with a concurrent create; report the whole chunk
+            self.db.rollback()
+            logger.warning(f"Bulk import chunk failed: {e}")
+            for result in results:
+                if result.status == "created":
+                    result.status = "error"
+                    result.id = None
+                    result.error = "Conflicts with a concurrent change, retry this row"
+            return results
+        
+        for values in rows:
+            self._seen_usernames.add(values["username"])
+            if values["email"]:
+                self._seen_emails.add(values["email"])
+            if values["is_active"]:
+                self.created_active_uuids.append(values["uuid"])
+        return results
+    
+    def filter_conditions(self, user_filter: BulkUserFilter) -> List:
+        """SQL conditions for a bulk filter"""
+        conditions = []
+        if user_filter.created_after is not None:
+            conditions.append(User.created_at >= user_filter.created_after)
+        if user_filter.created_before is not None:
+            conditions.append(User.created_at < user_filter.created_before)
+        if user_filter.username_prefix:
+            prefix = user_filter.username_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append(User.username.like(prefix + "%", escape="\\"))
+        if user_filter.is_active is not None:
+            conditions.append(User.is_active == user_filter.is_active)
+        if user_filter.expired is not None:
+            now = datetime.utcnow()
+            if user_filter.expired:
+                conditions.append(User.expire_date < now)
+            else:
+                conditions.append((User.expire_date == None) | (User.expire_date >= now))
+        return conditions
+    
+    def _extend_expire_date(self, days: int):
+        """SQL expression for expire_date + days (NULL stays NULL)"""
+        if self.db.get_bind().dialect.name == "sqlite":
+            # Keep SQLAlchemy's 'YYYY-MM-DD HH:MM:SS.ffffff' storage format
+            return func.strftime(
+                "%Y-%m-%d %H:%M:%S", User.expire_date, f"{days:+d} days"
+            ).concat(func.substr(User.expire_date, 20))
+        return User.expire_date + literal(timedelta(days=days))
+    
+    def update_by_filter(self, request: BulkUserUpdate) -> Tuple[List[str], List[str]]:
+        """
+        Apply a bulk update with a single UPDATE ... WHERE.
+        Returns (ids of matched users, UUIDs whose is_active flipped).
+        """
+        conditions = self.filter_conditions(request.filter)
+        
+        values = {"updated_at": datetime.utcnow()}
+        if request.extend_days:
+            values["expire_date"] = self._extend_expire_date(request.extend_days)
+        if request.data_limit is not None:
+            values["data_limit"] = request.data_limit
+        if request.is_active is not None:
+            values["is_active"] = request.is_active
+        if request.reset_data_used:
+            values["data_used"] = 0
+        
+        # Users whose activation actually changes need an Xray client update
+        flipped = []
+        if request.is_active is not None:
+            flipped = list(self.db.scalars(
+                select(User.uuid).where(*conditions, User.is_active != request.is_active)
+            ))
+        
+        stmt = (
+            update(User)
+            .where(*conditions)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            if self.db.get_bind().dialect.update_returning:
+                user_ids = list(self.db.scalars(stmt.returning(User.id)))
+            else:
+                user_ids = list(self.db.scalars(select(User.id).where(*conditions)))
+                self.db.execute(stmt)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        logger.info(f"Bulk update matched {len(user_ids)} users, {len(flipped)} activation changes")
+        return user_ids, flipped
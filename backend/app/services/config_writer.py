@@ -0,0 +1,100 @@
+"""
+Background Xray config writer
+Coalesces bursts of user/config mutations into a single
+generate_config + save_config (+ reload) run.
+"""
+import asyncio
+from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.services.background import BackgroundService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigWriter(BackgroundService):
+    """Single background task that rewrites the Xray config at most once per window"""
+    
+    name = "Xray config writer"
+    
+    def __init__(self, window: float = None):
+        super().__init__()
+        self.window = settings.xray_config_write_window if window is None else window
+        self.generation = 0  # Number of config writes applied so far
+        self._dirty = asyncio.Event()
+        self._reload = False
+        self._waiters: List[asyncio.Future] = []
+        self._flushing: Optional[asyncio.Future] = None  # Write in progress, if any
+    
+    async def _on_stop(self):
+        """Finish the write in progress and flush any pending change"""
+        # A write cancelled mid-way would leave its waiters unresolved
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        if self._dirty.is_set():
+            await self._flush()
+    
+    def mark_dirty(self, reload: bool = False) -> asyncio.Future:
+        """
+        Request a config rewrite. All requests made within the coalescing
+        window are applied together.
+        Returns a future resolved with True/False once the change is applied,
+        for callers that need read-your-writes.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._reload = self._reload or reload
+        self._dirty.set()
+        return waiter
+    
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            # Let the burst settle so it is written once
+            await asyncio.sleep(self.window)
+            # Shielded, so cancelling the task (stop()) lets a started write finish
+            self._flushing = asyncio.ensure_future(self._flush())
+            await asyncio.shield(self._flushing)
+    
+    async def _flush(self):
+        self._dirty.clear()
+        reload, self._reload = self._reload, False
+        waiters, self._waiters = self._waiters, []
+        
+        try:
+            applied = await self._apply(reload)
+        except Exception as e:
+            logger.error(f"Error writing Xray config: {e}")
+            applied = False
+        
+        if applied:
+            self.generation += 1
+        logger.info(f"Xray config write for {len(waiters)} change(s): {'ok' if applied else 'failed'}")
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(applied)
+    
+    async def _apply(self, reload: bool) -> bool:
+        """Regenerate the config from the database and save it if it changed"""
+        from app.services.reality_service import RealityService
+        from app.services.routing_service import RoutingService
+        from app.services.xray_service import XrayService
+        
+        db = SessionLocal()
+        try:
+            xray_service = XrayService(RealityService(db), RoutingService())
+            # Clients are streamed from the database while the file is written
+            config = await run_in_threadpool(xray_service.generate_config_streamed, db)
+            if not await xray_service.save_config_async(config):
+                return False
+            # Nothing to restart for if the file did not change
+            if reload and not xray_service.last_write_skipped:
+                return await run_in_threadpool(xray_service.reload_config)
+            return True
+        finally:
+            db.close()
+
+
+config_writer = ConfigWriter()
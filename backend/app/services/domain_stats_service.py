@@ -0,0 +1,96 @@
+"""
+Hourly per-domain access log aggregates
+Every batch of ingested access logs is folded into (hour, domain) counters
+with one upsert, so top-domains sums at most
+hours x distinct domains rows instead of scanning access_logs.
+"""
+import calendar
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import DomainStat
+import logging
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+
+
+def hour_bucket(timestamp: datetime) -> int:
+    """Unix time of the start of a (naive UTC) timestamp's hour"""
+    return calendar.timegm(timestamp.utctimetuple()) // HOUR * HOUR
+
+
+class DomainStatsService:
+    """Maintain and query the hourly domain aggregates"""
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def record(self, visits: Iterable[Tuple[datetime, Optional[str], int]]) -> int:
+        """
+        Add (timestamp, domain, bytes) visits to their hour buckets with one
+        executemany upsert. Does not commit, so the caller can write it in the
+        same transaction as the raw rows.
+        Returns the number of buckets touched.
+        """
+        counts: Dict[Tuple[int, str], List[int]] = {}
+        hours: Dict[datetime, int] = {}
+        for timestamp, domain, size in visits:
+            if not domain:
+                continue
+            # Timestamps repeat within a batch; convert each one once
+            hour = hours.get(timestamp)
+            if hour is None:
+                hour = hours[timestamp] = hour_bucket(timestamp)
+            entry = counts.get((hour, domain))
+            if entry is None:
+                entry = counts[(hour, domain)] = [0, 0]
+            entry[0] += 1
+            entry[1] += size
+        if not counts:
+            return 0
+        
+        table = DomainStat.__table__
+        stmt = dialect_insert(self.db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.hour_bucket, table.c.domain],
+            set_={
+                "visits": table.c.visits + stmt.excluded.visits,
+                "bytes": table.c.bytes + stmt.excluded.bytes,
+            }
+        )
+        self.db.execute(stmt, [
+            {"hour_bucket": hour, "domain": domain, "visits": entry[0], "bytes": entry[1]}
+            for (hour, domain), entry in counts.items()
+        ])
+        return len(counts)
+    
+    def top_domains(self, since: datetime, limit: int) -> List[Dict]:
+        """Most visited domains in the hours since `since` (hour granularity)"""
+        visits = func.sum(DomainStat.visits)
+        rows = self.db.execute(
+            select(DomainStat.domain, visits.label("visits"), func.sum(DomainStat.bytes).label("traffic"))
+            .where(DomainStat.hour_bucket >= hour_bucket(since))
+            .group_by(DomainStat.domain)
+            .order_by(visits.desc())
+            .limit(limit)
+        ).all()
+        return [
+            {"domain": row.domain, "visits": row.visits, "traffic": row.traffic or 0}
+            for row in rows
+        ]
+    
+    def prune(self, retention: timedelta) -> int:
+        """Delete buckets older than retention and commit"""
+        cutoff = hour_bucket(datetime.utcnow() - retention)
+        try:
+            deleted = self.db.execute(delete(DomainStat).where(DomainStat.hour_bucket < cutoff)).rowcount
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        logger.info(f"Deleted {deleted} old domain stats buckets")
+        return deleted
@@ -0,0 +1,163 @@
+"""
+Access log ingester
+Tails the Xray access log into the access_logs table from a persisted
+(inode, offset) checkpoint. The offset is committed in the same transaction
+as the rows it covers, so every line is stored once across restarts.
+
+Rotation is detected by an inode change: the rest of the old file is read
+first if it is still around as access.log.*, then the new file from the
+start. A file shorter than the checkpoint was truncated and is re-read
+from the start.
+"""
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.models import LogCheckpoint
+from app.services.access_log_service import AccessLogWriter
+from app.services.background import BackgroundService
+from app.utils.access_log import AccessLogParser
+import logging
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+# Bytes read per ingest_once call, so a large backlog commits progress as it goes
+MAX_READ_PER_RUN = 256 * 1024 * 1024
+
+
+class AccessLogIngester(BackgroundService):
+    """Background task that tails the access log in batched transactions"""
+    
+    def __init__(self, path: str = None, batch_size: int = None, poll_interval: float = None):
+        super().__init__()
+        self.path = Path(path or Path(settings.log_path) / "access.log")
+        self.batch_size = batch_size or settings.access_log_batch_size
+        self.poll_interval = poll_interval or settings.access_log_poll_interval
+        self.parser = AccessLogParser()
+        self.writer = AccessLogWriter()
+        self._missing = False  # Whether the missing log file was already reported
+    
+    @property
+    def name(self) -> str:
+        return f"Access log ingester for {self.path}"
+    
+    async def _run(self):
+        while True:
+            try:
+                read = await run_in_threadpool(self.ingest_once)
+            except Exception as e:
+                logger.error(f"Error ingesting access log: {e}")
+                read = 0
+            # Keep going without sleeping while there is a backlog
+            if read < MAX_READ_PER_RUN:
+                await asyncio.sleep(self.poll_interval)
+    
+    def _checkpoint(self, db: Session) -> LogCheckpoint:
+        checkpoint = db.get(LogCheckpoint, str(self.path))
+        if checkpoint is None:
+            checkpoint = LogCheckpoint(path=str(self.path), inode=None, offset=0)
+            db.add(checkpoint)
+        return checkpoint
+    
+    def _find_rotated(self, inode: int) -> Optional[Path]:
+        """The rotated (renamed, not yet compressed) file that used to be the log"""
+        for candidate in self.path.parent.glob(self.path.name + ".*"):
+            try:
+                if candidate.stat().st_ino == inode and candidate.suffix != ".gz":
+                    return candidate
+            except FileNotFoundError:
+                continue
+        return None
+    
+    def ingest_once(self) -> int:
+        """Ingest everything appended since the checkpoint. Returns bytes read."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            if not self._missing:
+                logger.warning(f"Access log {self.path} not found; is the Xray log directory mounted?")
+                self._missing = True
+            return 0
+        self._missing = False
+        
+        db = SessionLocal()
+        try:
+            checkpoint = self._checkpoint(db)
+            read = 0
+            if checkpoint.inode != stat.st_ino:
+                if checkpoint.inode is not None:
+                    rotated = self._find_rotated(checkpoint.inode)
+                    if rotated is not None:
+                        read += self._ingest_file(db, checkpoint, rotated, MAX_READ_PER_RUN)
+                        if read >= MAX_READ_PER_RUN:
+                            return read
+                    logger.info(f"Access log rotated, reading {self.path} from the start")
+                checkpoint.inode = stat.st_ino
+                checkpoint.offset = 0
+            elif stat.st_size < checkpoint.offset:
+                logger.info(f"Access log truncated, reading {self.path} from the start")
+                checkpoint.offset = 0
+            
+            read += self._ingest_file(db, checkpoint, self.path, MAX_READ_PER_RUN - read)
+            db.commit()
+            return read
+        except Exception:
+            db.rollback()
+            # Cached keys and IDs may have been created in the rolled back batch
+            self.writer.invalidate()
+            raise
+        finally:
+            db.close()
+    
+    def _ingest_file(self, db: Session, checkpoint: LogCheckpoint, path: Path, limit: int) -> int:
+        """Read complete lines from checkpoint.offset, committing every batch. Returns bytes read."""
+        parse = self.parser.parse
+        get_user_key = self.writer.user_key
+        read = 0
+        records: List[Tuple[datetime, int, str]] = []
+        with open(path, "rb") as f:
+            f.seek(checkpoint.offset)
+            pending = b""
+            while read < limit:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                read += len(chunk)
+                data = pending + chunk
+                base = f.tell() - len(data)  # File offset of data[0]
+                end = data.rfind(b"\n") + 1
+                # A partial last line is left for the next run
+                pending = data[end:]
+                
+                position = 0
+                for line in data[:end].split(b"\n")[:-1]:
+                    position += len(line) + 1
+                    parsed = parse(line.decode("utf-8", "replace"))
+                    if parsed is None:
+                        continue
+                    timestamp, email, domain = parsed
+                    user_key = get_user_key(db, email)
+                    if user_key is None:
+                        continue
+                    records.append((timestamp, user_key, domain))
+                    if len(records) >= self.batch_size:
+                        self._flush(db, checkpoint, records, base + position)
+                        records = []
+            
+            self._flush(db, checkpoint, records, f.tell() - len(pending))
+        return read
+    
+    def _flush(self, db: Session, checkpoint: LogCheckpoint, records: List[Tuple[datetime, int, str]], offset: int):
+        """Insert a batch and move the checkpoint past it in one transaction"""
+        self.writer.write(db, records)
+        checkpoint.offset = offset
+        checkpoint.updated_at = datetime.utcnow()
+        db.commit()
+
+
+log_ingester = AccessLogIngester()
@@ -0,0 +1,205 @@
+"""
+Live monitoring feed for the /monitoring/ws WebSocket
+A single background producer builds one frame per tick (online users,
+throughput, totals) and serializes it once, however many admins are
+watching. Each subscriber has its own bounded queue drained by its own
+connection; publishing is one put_nowait per subscriber and never waits
+on a socket.
+
+Frames are versioned. Every tick gets the next sequence number and is
+published as a delta against the previous tick: the OnlineUser entries
+that changed, the user IDs that went offline, and the (small) totals and
+throughput in full. A subscriber starts from a snapshot of the whole
+state at some seq and applies the deltas seq + 1, seq + 2, ... in order.
+Snapshots are serialized at most once per seq, only when someone needs
+one: a new subscriber, a subscriber whose queue overflowed (its pending
+deltas are replaced by a snapshot) or a client that saw a gap and asked
+for a resync.
+
+The same producer keeps the /monitoring/online-users body warm: after an
+HTTP request it goes on rebuilding and serializing the online users every
+tick for monitoring_http_keep_warm seconds, so a dashboard polling within
+that window is served bytes at most a tick or two old instead of a
+rebuild on the request path.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.services.background import BackgroundService
+from app.services.stats_service import StatsService
+from app.services.throughput_service import throughput
+from app.services.usage_service import UsageService
+from app.utils.serialization import dumps_compact
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MonitoringFeed(BackgroundService):
+    """Shared producer fanning out serialized monitoring deltas to subscriber queues"""
+    
+    name = "Monitoring feed"
+    
+    def __init__(self, interval: float = None, queue_size: int = None):
+        super().__init__()
+        self.interval = interval or settings.monitoring_feed_interval
+        self.queue_size = queue_size or settings.monitoring_feed_queue
+        self.seq = 0  # Sequence number of the latest published frame
+        self.dropped = 0  # Deltas discarded for slow subscribers
+        self._users: Optional[Dict[str, dict]] = None  # OnlineUser dicts by user ID at self.seq
+        self._summary: Dict[str, Any] = {}  # Totals and throughput at self.seq
+        self._snapshot: Optional[Tuple[int, str]] = None  # (seq, serialized snapshot)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._needs_snapshot: Set[asyncio.Queue] = set()
+        self._wakeup = asyncio.Event()
+        self._online_body: Optional[Tuple[float, bytes]] = None  # (monotonic build start, serialized online users)
+        self._wanted_until = 0.0  # Monotonic time until which HTTP readers keep the body warm
+        self._building = asyncio.Lock()  # One cold build at a time
+    
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving a snapshot first and every delta after it"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        if self._users is not None:
+            queue.put_nowait(self.snapshot())
+        else:
+            # Snapshot on the first tick, without waiting out an idle interval
+            self._needs_snapshot.add(queue)
+            self._wakeup.set()
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        self._needs_snapshot.discard(queue)
+        if not self._subscribers:
+            # Stale by the time anyone subscribes again; the next tick starts over
+            self._users = None
+            self._snapshot = None
+    
+    def resync(self, queue: asyncio.Queue):
+        """Replace a subscriber's pending frames with a snapshot of the latest state"""
+        if self._users is None:
+            # First tick still pending; it sends the snapshot
+            return
+        self._drain(queue)
+        queue.put_nowait(self.snapshot())
+    
+    def _drain(self, queue: asyncio.Queue):
+        while not queue.empty():
+            queue.get_nowait()
+            self.dropped += 1
+    
+    def snapshot(self) -> str:
+        """Full state at the current seq, serialized once per seq"""
+        if self._snapshot is None or self._snapshot[0] != self.seq:
+            self._snapshot = (self.seq, dumps_compact({
+                "type": "snapshot",
+                "seq": self.seq,
+                **self._summary,
+                "online_users": list(self._users.values()),
+            }).decode())
+        return self._snapshot[1]
+    
+    def publish(self, online_users: list, summary: Dict[str, Any]):
+        """
+        Advance to the next seq with the given state and send every
+        subscriber the delta, or a snapshot if it needs one or its queue
+        is full
+        """
+        users = {user["user_id"]: user for user in online_users}
+        previous = self._users or {}
+        changed = [user for user_id, user in users.items() if previous.get(user_id) != user]
+        removed = [user_id for user_id in previous if user_id not in users]
+        
+        self.seq += 1
+        self._users = users
+        self._summary = summary
+        delta = dumps_compact({
+            "type": "delta",
+            "seq": self.seq,
+            **summary,
+            "changed": changed,
+            "removed": removed,
+        }).decode()
+        
+        for queue in self._subscribers:
+            if queue in self._needs_snapshot or queue.full():
+                self._drain(queue)
+                queue.put_nowait(self.snapshot())
+            else:
+                queue.put_nowait(delta)
+        self._needs_snapshot.clear()
+    
+    async def online_users_body(self) -> bytes:
+        """
+        Serialized online users (OnlineUser dicts), built at most about two
+        ticks ago; built here only if the producer has not kept them warm
+        """
+        self._wanted_until = time.monotonic() + settings.monitoring_http_keep_warm
+        async with self._building:
+            if self._online_body is None or time.monotonic() - self._online_body[0] > 2 * self.interval:
+                started = time.monotonic()
+                await self._store_body(started, await self._online_users())
+        return self._online_body[1]
+    
+    async def _store_body(self, started: float, online_users: list):
+        self._online_body = (started, await run_in_threadpool(dumps_compact, online_users))
+    
+    async def _run(self):
+        while True:
+            # Nothing is built while nobody is watching or polling
+            watched = bool(self._subscribers)
+            wanted = time.monotonic() < self._wanted_until
+            if watched or wanted:
+                started = time.monotonic()
+                try:
+                    if watched:
+                        online_users, summary = await self.collect()
+                        if self._subscribers:
+                            self.publish(online_users, summary)
+                    else:
+                        online_users = await self._online_users()
+                    if wanted:
+                        await self._store_body(started, online_users)
+                except Exception as e:
+                    logger.error(f"Error building monitoring frame: {e}")
+            else:
+                self._online_body = None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def collect(self) -> Tuple[list, Dict[str, Any]]:
+        """Online users (OnlineUser dicts) and the frame summary: timestamp, totals and throughput"""
+        online_users = await self._online_users()
+        db = SessionLocal()
+        try:
+            total_traffic_24h = await run_in_threadpool(
+                UsageService(db).total_bytes, datetime.utcnow() - timedelta(hours=24)
+            )
+        finally:
+            db.close()
+        
+        return online_users, {
+            "timestamp": datetime.utcnow(),
+            "total_online": len(online_users),
+            "total_traffic_24h": total_traffic_24h,
+            "throughput": throughput.snapshot().model_dump(),
+        }
+    
+    async def _online_users(self) -> list:
+        db = SessionLocal()
+        try:
+            # Unsynced traffic from the sampler's latest read instead of another QueryStats
+            return await StatsService(db).list_online_users(unsynced=throughput.unsynced())
+        finally:
+            db.close()
+
+
+monitoring_feed = MonitoringFeed()
@@ -1,145 +1,358 @@
 """
 Stats Service for managing Xray statistics
 Reads stats from Xray via gRPC and updates database
+
+Xray counters are read with reset=True, so each read is a delta since the
+previous one and usage survives Xray restarts. Deltas are first written to
+the traffic_journal table and then added to users.data_used in a separate
+transaction, so a delta already reset in Xray is never lost if the process
+dies or the update fails before it is applied.
 """
+import asyncio
+from sqlalchemy import bindparam, delete, func, insert, select, update
 from sqlalchemy.orm import Session
-from typing import Dict, List, Optional
-from app.models import User
-from app.services.xray_grpc_client import XrayGRPCClient, XrayStatsParser
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional, Tuple
+from app.models import Device, User, TrafficJournal
+from app.services.xray_grpc_client import XrayGRPCClient, xray_grpc, parse_user_traffic
+from app.services.usage_service import UsageService
+from app.services.throughput_service import throughput
 from app.config import settings
+from datetime import datetime, timedelta
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Deltas already reset in Xray whose journal write failed; retried on the next sync
+_unjournaled: Dict[str, Dict[str, int]] = {}
+# Serializes syncs and resets: two concurrent apply_journal runs would both
+# sum the same journal rows, and _unjournaled is shared between them
+_sync_lock = asyncio.Lock()
+
 
 class StatsService:
     """Service for managing and syncing Xray statistics"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, grpc_client: XrayGRPCClient = None):
         self.db = db
-        self.grpc_client = None
+        self.grpc_client = grpc_client or xray_grpc
     
     def _get_grpc_client(self) -> Optional[XrayGRPCClient]:
-        """Get or create gRPC client"""
-        if not self.grpc_client:
-            try:
-                self.grpc_client = XrayGRPCClient()
-            except Exception as e:
-                logger.error(f"Failed to create gRPC client: {e}")
-                return None
+        """Get the shared gRPC client"""
         return self.grpc_client
     
-    def sync_user_stats(self, user: User) -> bool:
-        """Sync stats for a single user from Xray to database"""
+    def journal_deltas(self, deltas: Dict[str, Dict[str, int]]) -> int:
+        """
+        Persist traffic deltas (keyed by user UUID) to the journal.
+        Returns the number of rows written.
+        """
+        for user_uuid, stats in _unjournaled.items():
+            entry = deltas.setdefault(user_uuid, {'uplink': 0, 'downlink': 0, 'total': 0})
+            entry['uplink'] += stats['uplink']
+            entry['downlink'] += stats['downlink']
+        
+        rows = [
+            {"user_uuid": user_uuid, "uplink": stats['uplink'], "downlink": stats['downlink']}
+            for user_uuid, stats in deltas.items()
+            if stats['uplink'] or stats['downlink']
+        ]
+        if not rows:
+            _unjournaled.clear()
+            return 0
+        
         try:
+            self.db.execute(insert(TrafficJournal.__table__), rows)
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Error journaling traffic deltas, keeping them in memory: {e}")
+            self.db.rollback()
+            _unjournaled.clear()
+            _unjournaled.update({
+                row["user_uuid"]: {'uplink': row["uplink"], 'downlink': row["downlink"]}
+                for row in rows
+            })
+            return 0
+        
+        _unjournaled.clear()
+        return len(rows)
+    
+    def apply_journal(self) -> int:
+        """
+        Add all journaled deltas to users.data_used and clear them, in one
+        short transaction: one query resolves UUIDs to user IDs and sums the
+        deltas, then a single executemany UPDATE applies them and one
+        executemany upsert adds them to the per-minute usage buckets.
+        Returns the number of users updated.
+        """
+        last_id = self.db.scalar(select(func.max(TrafficJournal.id)))
+        if last_id is None:
+            return 0
+        
+        totals = self.db.execute(
+            select(
+                User.id,
+                func.sum(TrafficJournal.uplink),
+                func.sum(TrafficJournal.downlink)
+            )
+            .join(User, User.uuid == TrafficJournal.user_uuid)
+            .where(TrafficJournal.id <= last_id)
+            .group_by(User.id)
+        ).all()
+        
+        if totals:
+            users = User.__table__
+            self.db.execute(
+                update(users)
+                .where(users.c.id == bindparam("user_id"))
+                .values(
+                    data_used=func.coalesce(users.c.data_used, 0) + bindparam("delta"),
+                    last_active_at=datetime.utcnow()
+                ),
+                [
+                    {"user_id": user_id, "delta": (uplink or 0) + (downlink or 0)}
+                    for user_id, uplink, downlink in totals
+                ]
+            )
+            # Same transaction, so the time series always matches data_used
+            UsageService(self.db).record(totals)
+        
+        # Rows for unknown (deleted) users are dropped along with the rest
+        self.db.execute(delete(TrafficJournal).where(TrafficJournal.id <= last_id))
+        self.db.commit()
+        return len(totals)
+    
+    async def _collect(self, pattern: str) -> Optional[int]:
+        """
+        Read and reset the counters matching pattern, journal them and apply
+        the journal. Returns the number of users updated, or None if Xray
+        returned no counters.
+        """
+        async with _sync_lock:
             client = self._get_grpc_client()
             if not client:
                 logger.warning("gRPC client not available, skipping stats sync")
-                return False
+                return None
             
-            # Get stats from Xray
-            stats = client.get_user_stats(user.uuid)
+            started = time.perf_counter()
             
-            if stats:
-                # Update user data_used
-                user.data_used = stats.get('total', 0)
-                self.db.commit()
-                logger.debug(f"Synced stats for user {user.username}: {stats['total']} bytes")
-                return True
-            else:
+            # Apply anything left over from an interrupted previous sync first
+            recovered = await run_in_threadpool(self.apply_journal)
+            if recovered:
+                logger.info(f"Applied journaled traffic for {recovered} users")
+            
+            stats = await client.get_stats(pattern, reset=True)
+            if stats is None:
+                return recovered or None
+            read_done = time.perf_counter()
+            deltas = parse_user_traffic(stats)
+            throughput.on_reset(deltas)
+            if not deltas and not _unjournaled:
+                return recovered or None
+            
+            journaled = await run_in_threadpool(self.journal_deltas, deltas)
+            updated = await run_in_threadpool(self.apply_journal)
+            finished = time.perf_counter()
+            
+            logger.info(
+                f"Stats sync: {len(stats)} counters, {len(deltas)} users read, "
+                f"{journaled} journal rows, {updated} users updated in "
+                f"{finished - started:.3f}s (read {read_done - started:.3f}s, "
+                f"write {finished - read_done:.3f}s)"
+            )
+            return recovered + updated
+    
+    async def sync_user_stats(self, user: User) -> bool:
+        """Sync stats for a single user from Xray to database"""
+        try:
+            updated = await self._collect(f"user>>>{user.uuid}>>>traffic>>>")
+            if updated is None:
                 logger.warning(f"No stats found for user {user.uuid}")
                 return False
+            
+            await run_in_threadpool(self.db.refresh, user)
+            logger.debug(f"Synced stats for user {user.username}: {user.data_used} bytes")
+            return True
         except Exception as e:
             logger.error(f"Error syncing stats for user {user.id}: {e}")
             self.db.rollback()
             return False
     
-    def sync_all_users_stats(self) -> int:
-        """Sync stats for all active users"""
+    async def sync_all_users_stats(self) -> int:
+        """Sync stats for all users: add traffic since the last sync to data_used"""
         try:
-            client = self._get_grpc_client()
-            if not client:
-                logger.warning("gRPC client not available, skipping stats sync")
-                return 0
-            
-            # Get all users stats from Xray
-            all_stats = client.get_all_users_stats()
-            
-            if not all_stats:
+            updated_count = await self._collect("user>>>")
+            if updated_count is None:
                 logger.warning("No stats received from Xray")
                 return 0
             
-            # Update database for each user
-            updated_count = 0
-            for user_uuid, stats in all_stats.items():
-                user = self.db.query(User).filter(User.uuid == user_uuid).first()
-                if user:
-                    user.data_used = stats.get('total', 0)
-                    updated_count += 1
-            
-            self.db.commit()
-            logger.info(f"Synced stats for {updated_count} users")
             return updated_count
         except Exception as e:
             logger.error(f"Error syncing all users stats: {e}")
             self.db.rollback()
             return 0
     
-    def get_user_traffic(self, user_uuid: str) -> Dict[str, int]:
-        """Get current traffic stats for a user"""
+    async def get_user_traffic(self, user_uuid: str) -> Dict[str, int]:
+        """Get traffic for a user since the last stats sync"""
         try:
             client = self._get_grpc_client()
             if not client:
                 return {'uplink': 0, 'downlink': 0, 'total': 0}
             
-            return client.get_user_stats(user_uuid)
+            return await client.get_user_stats(user_uuid)
         except Exception as e:
             logger.error(f"Error getting user traffic: {e}")
             return {'uplink': 0, 'downlink': 0, 'total': 0}
     
-    def get_online_users(self) -> List[str]:
-        """Get list of online user UUIDs"""
+    async def get_all_users_traffic(self) -> Dict[str, Dict[str, int]]:
+        """Get traffic of every user since the last stats sync in one QueryStats call"""
         try:
             client = self._get_grpc_client()
             if not client:
-                return []
+                return {}
             
-            # Get all users stats - users with recent activity are considered online
-            all_stats = client.get_all_users_stats()
-            # Filter users with recent traffic (in last 5 minutes)
-            # This is a simplified check - in production, you'd check last activity time
-            online_users = [uuid for uuid, stats in all_stats.items() if stats.get('total', 0) > 0]
-            return online_users
+            return await client.get_all_users_stats()
+        except Exception as e:
+            logger.error(f"Error getting users traffic: {e}")
+            return {}
+    
+    async def get_online_users(self) -> List[str]:
+        """
+        Get list of online user UUIDs: users with a live connection according
+        to Xray's online stats, or, if Xray cannot report them, users whose
+        traffic moved within the online window (indexed on last_active_at)
+        """
+        try:
+            client = self._get_grpc_client()
+            online_users = await client.get_online_users() if client else None
+            if online_users is not None:
+                return online_users
+            
+            return self.get_recently_active_users()
         except Exception as e:
             logger.error(f"Error getting online users: {e}")
             return []
     
-    def reset_user_stats(self, user_uuid: str) -> bool:
-        """Reset stats for a user in Xray"""
+    def get_recently_active_users(self) -> List[str]:
+        """UUIDs of active users whose counters moved within the online window"""
+        cutoff = datetime.utcnow() - timedelta(minutes=settings.online_window_minutes)
+        return list(self.db.scalars(
+            select(User.uuid).where(User.last_active_at >= cutoff, User.is_active == True)
+        ))
+    
+    def _online_rows(self, online_user_uuids: List[str]) -> Tuple[list, Dict[str, List[dict]]]:
+        """User rows and their devices (by user ID) for online user UUIDs, in two queries"""
+        # Core execution (no ORM result loading) with expanding bind parameters,
+        # since in_(list) would coerce every value into its own literal
+        connection = self.db.connection()
+        users = connection.execute(
+            select(User.id, User.username, User.uuid, User.data_used, User.data_limit, User.last_active_at)
+            .where(User.uuid.in_(bindparam("uuids", expanding=True)), User.is_active == True),
+            {"uuids": online_user_uuids}
+        ).all()
+        if not users:
+            return [], {}
+        
+        # Devices of all online users in one query, fetched in one call (not
+        # iterated, which fetches row by row). Rows are unpacked as tuples
+        # throughout: attribute access on Rows is slow at this row count.
+        devices: Dict[str, List[dict]] = {}
+        for user_id, device_id, fingerprint, user_agent, device_last_seen, created_at in connection.execute(
+            select(Device.user_id, Device.id, Device.fingerprint, Device.user_agent, Device.last_seen, Device.created_at)
+            .where(Device.user_id.in_(bindparam("user_ids", expanding=True))),
+            {"user_ids": [user[0] for user in users]}
+        ).all():
+            device = {
+                "id": device_id,
+                "fingerprint": fingerprint,
+                "user_agent": user_agent,
+                "last_seen": device_last_seen,
+                "created_at": created_at,
+            }
+            user_devices = devices.get(user_id)
+            if user_devices is None:
+                devices[user_id] = [device]
+            else:
+                user_devices.append(device)
+        return users, devices
+    
+    async def list_online_users(self, ips: bool = False, unsynced: Dict[str, int] = None) -> List[dict]:
+        """
+        Online users as OnlineUser dicts, from one online list call, one users
+        query and one devices query (in the threadpool). Traffic not yet synced
+        is taken from `unsynced` (bytes per UUID, e.g. throughput.unsynced())
+        or else read with one QueryStats call.
+        """
+        online_user_uuids = await self.grpc_client.get_online_users()
+        from_xray = online_user_uuids is not None
+        if not from_xray:
+            # Fallback to recent traffic (indexed on last_active_at)
+            online_user_uuids = await run_in_threadpool(self.get_recently_active_users)
+        if not online_user_uuids:
+            return []
+        
+        users, devices = await run_in_threadpool(self._online_rows, online_user_uuids)
+        if not users:
+            return []
+        
+        if unsynced is None:
+            unsynced = {
+                user_uuid: stats["total"] for user_uuid, stats in (await self.get_all_users_traffic()).items()
+            }
+        ip_lists = {}
+        if ips and from_xray:
+            ip_lists = await self.grpc_client.get_online_ip_lists([user[2] for user in users])
+        
+        now = datetime.utcnow()
+        online_users_list = [None] * len(users)
+        for i, (user_id, username, user_uuid, data_used, data_limit, last_active_at) in enumerate(users):
+            user_ips = ip_lists.get(user_uuid)
+            if user_ips:
+                last_seen = datetime.utcfromtimestamp(max(user_ips.values()))
+            else:
+                last_seen = last_active_at or now
+            
+            online_users_list[i] = {
+                "user_id": user_id,
+                "username": username,
+                "uuid": user_uuid,
+                "data_used": (data_used or 0) + unsynced.get(user_uuid, 0),
+                "data_limit": data_limit,
+                "last_seen": last_seen,
+                "devices": devices.get(user_id, []),
+                "ips": sorted(user_ips) if user_ips else [],
+            }
+        
+        return online_users_list
+    
+    def _clear_usage(self, user_uuid: str):
+        """Drop a user's unapplied deltas and zero data_used"""
+        self.db.execute(delete(TrafficJournal).where(TrafficJournal.user_uuid == user_uuid))
+        self.db.execute(update(User).where(User.uuid == user_uuid).values(data_used=0))
+        self.db.commit()
+    
+    async def reset_user_stats(self, user_uuid: str) -> bool:
+        """Reset a user's usage: Xray counters, unapplied deltas and data_used"""
         try:
             client = self._get_grpc_client()
             if not client:
                 return False
             
-            # Reset stats by getting with reset=True
-            client.get_stats(f"user>>>{user_uuid}>>>traffic>>>uplink", reset=True)
-            client.get_stats(f"user>>>{user_uuid}>>>traffic>>>downlink", reset=True)
-            
-            # Also update database
-            user = self.db.query(User).filter(User.uuid == user_uuid).first()
-            if user:
-                user.data_used = 0
-                self.db.commit()
+            async with _sync_lock:
+                # Reset uplink and downlink counters with a single QueryStats(reset=True)
+                # and drop the traffic read so far
+                stats = await client.get_stats(f"user>>>{user_uuid}>>>traffic>>>", reset=True)
+                if stats is None:
+                    # Xray kept its counters; zeroing data_used now would be undone by the next sync
+                    logger.error(f"Could not reset Xray counters for user {user_uuid}, usage left as is")
+                    return False
+                throughput.on_reset(parse_user_traffic(stats))
+                _unjournaled.pop(user_uuid, None)
+                await run_in_threadpool(self._clear_usage, user_uuid)
             
             logger.info(f"Reset stats for user {user_uuid}")
             return True
         except Exception as e:
             logger.error(f"Error resetting user stats: {e}")
+            self.db.rollback()
             return False
-    
-    def close(self):
-        """Close gRPC connection"""
-        if self.grpc_client:
-            self.grpc_client.close()
-            self.grpc_client = None
-
@@ -0,0 +1,199 @@
+"""
+Live per-user throughput
+A background sampler reads the Xray user counters (without resetting them)
+every few seconds into a fixed-size ring buffer held in this process, so
+current/peak bytes per second and the top talkers are derived without
+touching the database. Decoding a sample and recording it runs in the
+threadpool (it is linear in the number of users); a lock keeps the buffer
+consistent for the readers on the event loop.
+
+The stats sync resets the counters it reads; it hands the values it read to
+on_reset so the bytes counted between the last sample and the reset still
+show up in the next sample. A sample whose read was in flight during a
+reset may hold pre-reset values and is dropped (see generation).
+"""
+import asyncio
+import heapq
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.schemas import ThroughputStats, UserThroughput
+from app.services.background import BackgroundService
+from app.services.xray_grpc_client import XrayGRPCClient, parse_user_totals, xray_grpc
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ThroughputMonitor(BackgroundService):
+    """
+    Ring buffer of the last N samples per active user
+    Every user has one array('q') row of byte deltas; all rows share one
+    array('d') of sample times and a single head index. Only users with
+    traffic within the window have a row.
+    """
+    
+    name = "Throughput sampler"
+    
+    def __init__(self, samples: int = None, interval: float = None, grpc_client: XrayGRPCClient = None):
+        self.samples = samples or settings.throughput_samples
+        self.interval = interval or settings.throughput_sample_interval
+        super().__init__()
+        self.grpc_client = grpc_client or xray_grpc
+        self.times = array('d', [0.0] * self.samples)
+        self.totals = array('q', [0] * self.samples)  # Sum of all users' deltas per sample
+        self.head = -1  # Slot of the newest sample
+        self.count = 0  # Samples taken so far, capped at self.samples
+        self.taken = 0  # Samples taken so far
+        self.generation = 0  # Counter resets seen so far
+        self._rows: Dict[str, array] = {}
+        self._active_at: Dict[str, int] = {}  # Sample number of each row's newest nonzero delta
+        self._slot_users: List[Set[str]] = [set() for _ in range(self.samples)]  # Nonzero deltas per slot
+        self._last: Dict[str, int] = {}  # Counter value at the previous sample
+        self._pending: Dict[str, int] = {}  # Bytes read by a reset since the previous sample
+        self._lock = threading.Lock()
+    
+    async def _run(self):
+        while True:
+            try:
+                generation = self.generation
+                response = await self.grpc_client.query_stats_raw("user>>>")
+                if response is not None:
+                    await run_in_threadpool(self._sample, response, generation)
+            except Exception as e:
+                logger.error(f"Error sampling throughput: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def _sample(self, response: bytes, generation: int):
+        if not self.record(parse_user_totals(response), generation=generation):
+            logger.debug("Throughput sample read across a counter reset, dropped")
+    
+    def on_reset(self, users_stats: Dict[str, Dict[str, int]]):
+        """Counters were read with reset=True; keep what they held since the previous sample"""
+        with self._lock:
+            self.generation += 1
+            if not self.count:
+                return
+            for user_uuid, stats in users_stats.items():
+                counted = stats['total'] - self._last.pop(user_uuid, 0)
+                if counted > 0:
+                    self._pending[user_uuid] = self._pending.get(user_uuid, 0) + counted
+    
+    def unsynced(self) -> Optional[Dict[str, int]]:
+        """
+        Counter values at the latest sample: the bytes per user not yet read by
+        the stats sync, as of that sample. None before the first sample.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            return dict(self._last)
+    
+    def _row(self, user_uuid: str) -> array:
+        row = self._rows.get(user_uuid)
+        if row is None:
+            row = self._rows[user_uuid] = array('q', [0] * self.samples)
+        return row
+    
+    def record(self, counters: Dict[str, int], now: float = None, generation: int = None) -> bool:
+        """
+        Add one sample of {user UUID: uplink + downlink counter}.
+        A counter lower than at the previous sample was reset in between.
+        The first sample only sets the baseline.
+        generation is self.generation from before the counters were read; if
+        a reset was handed to on_reset since, the sample is dropped and False
+        returned, as it may hold values the reset already counted.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            first = self.count == 0
+            self.taken += 1
+            self.head = (self.head + 1) % self.samples
+            self.count = min(self.count + 1, self.samples)
+            self.times[self.head] = time.monotonic() if now is None else now
+            
+            deltas, self._pending = self._pending, {}
+            for user_uuid, value in counters.items():
+                last = self._last.get(user_uuid, value if first else 0)
+                self._last[user_uuid] = value
+                delta = value - last if value >= last else value
+                if delta:
+                    deltas[user_uuid] = deltas.get(user_uuid, 0) + delta
+            
+            # Only rows nonzero in the slot being overwritten need clearing;
+            # those idle since then are idle for the whole window and dropped
+            expired = self.taken - self.samples
+            for user_uuid in self._slot_users[self.head]:
+                if user_uuid in deltas:
+                    continue
+                self._rows[user_uuid][self.head] = 0
+                if self._active_at[user_uuid] <= expired:
+                    del self._rows[user_uuid]
+                    del self._active_at[user_uuid]
+                    if user_uuid not in counters:
+                        self._last.pop(user_uuid, None)
+            
+            total = 0
+            for user_uuid, delta in deltas.items():
+                self._row(user_uuid)[self.head] = delta
+                self._active_at[user_uuid] = self.taken
+                total += delta
+            self.totals[self.head] = total
+            self._slot_users[self.head] = set(deltas)
+            return True
+    
+    def _durations(self) -> List[Tuple[int, float]]:
+        """(slot, seconds since the previous sample) for each sample with a predecessor"""
+        durations = []
+        for age in range(self.count - 1):
+            slot = (self.head - age) % self.samples
+            elapsed = self.times[slot] - self.times[slot - 1]
+            if elapsed > 0:
+                durations.append((slot, elapsed))
+        return durations
+    
+    def rates(self, user_uuid: str) -> Tuple[float, float]:
+        """(current, peak) bytes/sec of a user over the window"""
+        with self._lock:
+            row = self._rows.get(user_uuid)
+            durations = self._durations()
+            if row is None or not durations:
+                return 0.0, 0.0
+            current = row[durations[0][0]] / durations[0][1]
+            return current, max(row[slot] / elapsed for slot, elapsed in durations)
+    
+    def snapshot(self, top: int = 10) -> ThroughputStats:
+        """Total current/peak bytes/sec and the top talkers by current rate"""
+        with self._lock:
+            durations = self._durations()
+            if not durations:
+                return ThroughputStats(interval=self.interval, window=0, active_users=len(self._rows),
+                                       current_bps=0, peak_bps=0, top_users=[])
+            
+            head, elapsed = durations[0]
+            rows = self._rows
+            totals = [self.totals[slot] / seconds for slot, seconds in durations]
+            talkers = heapq.nlargest(top, rows.items(), key=lambda item: item[1][head])
+            return ThroughputStats(
+                interval=self.interval,
+                window=sum(seconds for _, seconds in durations),
+                active_users=len(rows),
+                current_bps=totals[0],
+                peak_bps=max(totals),
+                top_users=[
+                    UserThroughput(
+                        uuid=user_uuid,
+                        current_bps=row[head] / elapsed,
+                        peak_bps=max(row[slot] / seconds for slot, seconds in durations)
+                    )
+                    for user_uuid, row in talkers
+                    if row[head] > 0
+                ]
+            )
+
+
+throughput = ThroughputMonitor()
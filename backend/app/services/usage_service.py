@@ -0,0 +1,263 @@
+"""
+Per-user traffic time series
+The stats sync adds each user's delta to a per-minute bucket. A scheduled
+rollup sums completed minutes into hourly and completed hours into daily
+buckets, then drops buckets past their tier's retention:
+minutes for a day, hours for a month, days for a year.
+
+A tier is complete up to its watermark (end of its newest bucket); anything
+newer is still only in the finer tiers, so queries read the coarse tier up
+to its watermark and the finer tiers for the tail.
+"""
+import calendar
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import TrafficBucket
+import logging
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# (bucket width in seconds, retention), finest first
+TIERS: List[Tuple[int, timedelta]] = [
+    (MINUTE, timedelta(days=1)),
+    (HOUR, timedelta(days=31)),
+    (DAY, timedelta(days=365)),
+]
+
+# Upper bound on points returned by one usage query
+MAX_POINTS = 1500
+
+
+def to_epoch(dt: datetime) -> int:
+    """Unix time of a datetime; naive datetimes are taken as UTC"""
+    return calendar.timegm(dt.utctimetuple())
+
+
+def to_naive_utc(dt: datetime) -> datetime:
+    """Convert an aware datetime to naive UTC; naive ones are returned as is"""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def from_epoch(ts: int) -> datetime:
+    """Naive UTC datetime of a Unix time, like the rest of the models"""
+    return datetime.utcfromtimestamp(ts)
+
+
+class UsageService:
+    """Record, downsample and query per-user traffic buckets"""
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def record(self, deltas: Iterable[Tuple[str, int, int]], now: datetime = None) -> int:
+        """
+        Add (user_id, uplink, downlink) deltas to the current minute bucket
+        with one executemany upsert. Does not commit, so the caller can apply
+        it in the same transaction as data_used.
+        Returns the number of rows written.
+        """
+        now_ts = to_epoch(now or datetime.utcnow())
+        bucket_start = now_ts - now_ts % MINUTE
+        rows = [
+            {"step": MINUTE, "user_id": user_id, "bucket_start": bucket_start,
+             "uplink": uplink or 0, "downlink": downlink or 0}
+            for user_id, uplink, downlink in deltas
+        ]
+        if not rows:
+            return 0
+        
+        stmt = dialect_insert(self.db, TrafficBucket.__table__)
+        buckets = TrafficBucket.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[buckets.c.step, buckets.c.user_id, buckets.c.bucket_start],
+            set_={
+                "uplink": buckets.c.uplink + stmt.excluded.uplink,
+                "downlink": buckets.c.downlink + stmt.excluded.downlink,
+            }
+        )
+        self.db.execute(stmt, rows)
+        return len(rows)
+    
+    def watermark(self, step: int) -> Optional[int]:
+        """End of the newest bucket in a tier, or None if the tier is empty"""
+        last = self.db.scalar(
+            select(func.max(TrafficBucket.bucket_start)).where(TrafficBucket.step == step)
+        )
+        return None if last is None else last + step
+    
+    def rollup(self, now: datetime = None) -> Dict[int, int]:
+        """
+        Sum completed minute buckets into hours and completed hours into days,
+        then apply retention to every tier.
+        The newest existing coarse bucket is recomputed rather than added to,
+        so running the job twice (or late) never double counts.
+        Returns {step: rows written} per coarse tier.
+        """
+        now_ts = to_epoch(now or datetime.utcnow())
+        buckets = TrafficBucket.__table__
+        written = {}
+        
+        try:
+            for (source, _), (target, _) in zip(TIERS, TIERS[1:]):
+                end = now_ts - now_ts % target
+                last = self.db.scalar(
+                    select(func.max(buckets.c.bucket_start)).where(buckets.c.step == target)
+                )
+                start = last if last is not None else 0
+                
+                target_start = (buckets.c.bucket_start // target) * target
+                rows = (
+                    select(
+                        literal(target).label("step"),
+                        buckets.c.user_id,
+                        target_start.label("bucket_start"),
+                        func.sum(buckets.c.uplink).label("uplink"),
+                        func.sum(buckets.c.downlink).label("downlink"),
+                    )
+                    .where(
+                        buckets.c.step == source,
+                        buckets.c.bucket_start >= start,
+                        buckets.c.bucket_start < end,
+                    )
+                    .group_by(buckets.c.user_id, target_start)
+                )
+                stmt = dialect_insert(self.db, TrafficBucket.__table__).from_select(
+                    ["step", "user_id", "bucket_start", "uplink", "downlink"], rows
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[buckets.c.step, buckets.c.user_id, buckets.c.bucket_start],
+                    set_={"uplink": stmt.excluded.uplink, "downlink": stmt.excluded.downlink}
+                )
+                written[target] = self.db.execute(stmt).rowcount
+            
+            # Only after the rollup above, so nothing is dropped before it is summed
+            for step, retention in TIERS:
+                cutoff = now_ts - int(retention.total_seconds())
+                self.db.execute(
+                    delete(TrafficBucket).where(
+                        TrafficBucket.step == step,
+                        TrafficBucket.bucket_start < cutoff
+                    )
+                )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        logger.info(f"Traffic rollup: {written.get(HOUR, 0)} hourly, {written.get(DAY, 0)} daily buckets")
+        return written
+    
+    def _tier_total(self, tier: int, start: int, end: int) -> int:
+        """Uplink + downlink of all users in one tier's buckets starting in [start, end)"""
+        if start >= end:
+            return 0
+        total = self.db.scalar(
+            select(func.sum(TrafficBucket.uplink + TrafficBucket.downlink)).where(
+                TrafficBucket.step == tier,
+                TrafficBucket.bucket_start >= start,
+                TrafficBucket.bucket_start < end,
+            )
+        )
+        return total or 0
+    
+    def total_bytes(self, start: datetime, end: datetime = None) -> int:
+        """
+        Traffic of all users in [start, end), to the minute: whole hours up to
+        the hour watermark from the hour tier, the partial first hour and
+        the tail from minutes. start must be within minute retention.
+        """
+        start_ts = to_epoch(start)
+        end_ts = to_epoch(end or datetime.utcnow())
+        first_hour = min(end_ts, -(-start_ts // HOUR) * HOUR)
+        hours_end = max(first_hour, min(end_ts - end_ts % HOUR, self.watermark(HOUR) or first_hour))
+        return (
+            self._tier_total(MINUTE, start_ts, first_hour)
+            + self._tier_total(HOUR, first_hour, hours_end)
+            + self._tier_total(MINUTE, hours_end, end_ts)
+        )
+    
+    def delete_user(self, user_id: str):
+        """Drop all buckets of a user (does not commit)"""
+        self.db.execute(delete(TrafficBucket).where(TrafficBucket.user_id == user_id))
+    
+    def covering_step(self, start: datetime, now: datetime = None) -> int:
+        """
+        Finest tier whose retention still reaches back to start; a query from
+        start needs a step that is a multiple of it, since finer buckets that
+        old have been dropped
+        """
+        age = to_epoch(now or datetime.utcnow()) - to_epoch(start)
+        for step, retention in TIERS:
+            if age <= retention.total_seconds():
+                return step
+        return TIERS[-1][0]
+    
+    def pick_step(self, start: datetime, end: datetime, now: datetime = None) -> int:
+        """Finest tier that still covers start and fits the range in MAX_POINTS"""
+        age = to_epoch(now or datetime.utcnow()) - to_epoch(start)
+        span = to_epoch(end) - to_epoch(start)
+        for step, retention in TIERS:
+            if age <= retention.total_seconds() and span <= step * MAX_POINTS:
+                return step
+        return TIERS[-1][0]
+    
+    def _sum_tier(self, user_id: str, tier: int, step: int, origin: int,
+                  start: int, end: int) -> List[Tuple[int, int, int]]:
+        """(point start, uplink, downlink) of one tier in [start, end), in step-wide points from origin"""
+        if start >= end:
+            return []
+        point = origin + ((TrafficBucket.bucket_start - origin) // step) * step
+        return self.db.execute(
+            select(point, func.sum(TrafficBucket.uplink), func.sum(TrafficBucket.downlink))
+            .where(
+                TrafficBucket.step == tier,
+                TrafficBucket.user_id == user_id,
+                TrafficBucket.bucket_start >= start,
+                TrafficBucket.bucket_start < end,
+            )
+            .group_by(point)
+        ).all()
+    
+    def query(self, user_id: str, start: datetime, end: datetime, step: int,
+              now: datetime = None) -> List[Tuple[int, int, int]]:
+        """
+        Usage of a user in [start, end) as dense (point start, uplink, downlink)
+        points of step seconds, aligned to step; step must be a multiple of
+        covering_step(start). The coarsest tier dividing step answers up to
+        its watermark, finer tiers the rest.
+        Raises ValueError for a step no retained tier can answer.
+        """
+        covering = self.covering_step(start, now)
+        if step % covering:
+            raise ValueError(f"step must be a multiple of {covering} seconds for data this old")
+        
+        start_ts = to_epoch(start)
+        start_ts -= start_ts % step
+        end_ts = to_epoch(end)
+        
+        totals: Dict[int, List[int]] = {}
+        cursor = start_ts
+        for tier in reversed([tier for tier, _ in TIERS if step % tier == 0]):
+            if cursor >= end_ts:
+                break
+            # The minute tier holds everything recorded so far
+            upto = end_ts if tier == MINUTE else min(end_ts, self.watermark(tier) or cursor)
+            for point, uplink, downlink in self._sum_tier(user_id, tier, step, start_ts, cursor, upto):
+                entry = totals.setdefault(point, [0, 0])
+                entry[0] += uplink or 0
+                entry[1] += downlink or 0
+            cursor = max(cursor, upto)
+        
+        return [
+            (point, *totals.get(point, (0, 0)))
+            for point in range(start_ts, end_ts, step)
+        ]
@@ -1,160 +1,287 @@
 """
 Xray gRPC Client for StatsService and HandlerService
-Note: This is a simplified implementation. For full functionality,
-Xray proto files need to be compiled and imported.
+Uses the vendored Xray protos in app/proto.
 """
+import asyncio
 import grpc
 from typing import Dict, Optional, List
 from app.config import settings
+from app.proto import (
+    handler_command_pb2,
+    handler_command_pb2_grpc,
+    stats_command_pb2,
+    stats_command_pb2_grpc,
+    typed_message_pb2,
+    user_pb2,
+    vless_account_pb2,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# QueryStats for every user counter can exceed gRPC's 4 MB default
+MAX_MESSAGE_LENGTH = 64 * 1024 * 1024
+
+# Concurrent GetStatsOnlineIpList calls when fetching IPs for many users
+ONLINE_IP_CONCURRENCY = 64
+
+
+def to_typed_message(message) -> typed_message_pb2.TypedMessage:
+    """Wrap a proto message into Xray's TypedMessage envelope"""
+    return typed_message_pb2.TypedMessage(
+        type=message.DESCRIPTOR.full_name,
+        value=message.SerializeToString()
+    )
+
+
+def parse_user_traffic(stats: Dict[str, int]) -> Dict[str, Dict[str, int]]:
+    """
+    Group user>>>{email}>>>traffic>>>{uplink|downlink} counters by email
+    Returns {email: {'uplink': int, 'downlink': int, 'total': int}}
+    """
+    users_stats = {}
+    for stat_name, value in stats.items():
+        parts = stat_name.split(">>>")
+        if len(parts) != 4 or parts[0] != "user" or parts[2] != "traffic":
+            continue
+        entry = users_stats.get(parts[1])
+        if entry is None:
+            entry = users_stats[parts[1]] = {'uplink': 0, 'downlink': 0, 'total': 0}
+        if parts[3] in ('uplink', 'downlink'):
+            entry[parts[3]] = value
+    
+    for entry in users_stats.values():
+        entry['total'] = entry['uplink'] + entry['downlink']
+    return users_stats
+
+
+def parse_user_totals(response: bytes) -> Dict[str, int]:
+    """
+    uplink + downlink per user from a serialized QueryStatsResponse
+    (see query_stats_raw); CPU-bound on large responses, so meant for a
+    worker thread
+    """
+    totals: Dict[str, int] = {}
+    for stat in stats_command_pb2.QueryStatsResponse.FromString(response).stat:
+        parts = stat.name.split(">>>")
+        if len(parts) == 4 and parts[0] == "user" and parts[2] == "traffic" and parts[3] in ("uplink", "downlink"):
+            totals[parts[1]] = totals.get(parts[1], 0) + stat.value
+    return totals
+
 
 class XrayGRPCClient:
-    """gRPC client for Xray StatsService and HandlerService"""
+    """
+    Async gRPC client for Xray StatsService and HandlerService
+    One long-lived grpc.aio channel with keepalive is shared by the whole app
+    (see xray_grpc below); every call carries its own deadline.
+    """
     
     def __init__(self, address: str = None):
         self.address = address or settings.xray_grpc_address
-        self.channel = None
-        self._connect()
+        self.timeout = settings.xray_grpc_timeout
+        self.channel: Optional[grpc.aio.Channel] = None
+        self._handler_stub = None
+        self._stats_stub = None
+        self._query_stats_raw = None
+        
+        # Parse address (format: host:port)
+        if ':' not in self.address:
+            self.address = f"{self.address}:8080"
     
-    def _connect(self):
-        """Establish gRPC connection"""
-        try:
-            # Parse address (format: host:port)
-            if ':' not in self.address:
-                self.address = f"{self.address}:8080"
-            
-            host, port = self.address.split(':')
-            self.channel = grpc.insecure_channel(f"{host}:{port}")
-            logger.info(f"Connected to Xray gRPC at {self.address}")
-        except Exception as e:
-            logger.error(f"Failed to connect to Xray gRPC: {e}")
+    def connect(self):
+        """Open the channel; must be called from the running event loop"""
+        if self.channel is not None:
+            return
+        
+        keepalive_ms = int(settings.xray_grpc_keepalive * 1000)
+        self.channel = grpc.aio.insecure_channel(
+            self.address,
+            options=[
+                ("grpc.max_receive_message_length", MAX_MESSAGE_LENGTH),
+                ("grpc.keepalive_time_ms", keepalive_ms),
+                ("grpc.keepalive_timeout_ms", int(self.timeout * 1000)),
+                ("grpc.keepalive_permit_without_calls", 1),
+                ("grpc.http2.max_pings_without_data", 0),
+            ]
+        )
+        logger.info(f"Opened Xray gRPC channel to {self.address}")
+    
+    async def close(self):
+        """Close the channel"""
+        if self.channel is not None:
+            await self.channel.close()
             self.channel = None
+            self._handler_stub = None
+            self._stats_stub = None
+            self._query_stats_raw = None
+            logger.info("Closed Xray gRPC channel")
+    
+    @property
+    def state(self) -> str:
+        """Connectivity state of the channel, e.g. READY or TRANSIENT_FAILURE"""
+        if self.channel is None:
+            return "CLOSED"
+        return self.channel.get_state().name
     
-    def get_stats(self, pattern: str = "", reset: bool = False) -> Dict[str, int]:
+    def _get_stats_stub(self) -> stats_command_pb2_grpc.StatsServiceStub:
+        """Get or create StatsService stub"""
+        if not self._stats_stub:
+            self.connect()
+            self._stats_stub = stats_command_pb2_grpc.StatsServiceStub(self.channel)
+        return self._stats_stub
+    
+    def _get_handler_stub(self) -> handler_command_pb2_grpc.HandlerServiceStub:
+        """Get or create HandlerService stub"""
+        if not self._handler_stub:
+            self.connect()
+            self._handler_stub = handler_command_pb2_grpc.HandlerServiceStub(self.channel)
+        return self._handler_stub
+    
+    async def get_stats(self, pattern: str = "", reset: bool = False) -> Optional[Dict[str, int]]:
         """
-        Get stats from Xray StatsService
-        Pattern format: "user>>>{uuid}>>>traffic>>>uplink" or "user>>>{uuid}>>>traffic>>>downlink"
-        Returns dict of stat_name: value
+        Get stats from Xray StatsService with a single QueryStats call
+        Pattern is a substring of the counter name, e.g. "user>>>" for all user
+        counters or "user>>>{uuid}>>>traffic>>>uplink" for one counter
+        Returns dict of stat_name: value, or None if the call failed (so a
+        reset that did not happen is not mistaken for zero counters)
         """
-        if not self.channel:
-            logger.warning("gRPC channel not connected")
-            return {}
-        
         try:
-            # Note: This requires Xray proto files to be compiled
-            # For now, we'll use a workaround with HTTP API or log parsing
-            # In production, you should compile Xray proto files:
-            # from app.proto import stats_pb2, stats_pb2_grpc
-            # stub = stats_pb2_grpc.StatsServiceStub(self.channel)
-            # response = stub.GetStats(stats_pb2.GetStatsRequest(name=pattern, reset=reset))
-            
-            logger.debug(f"Getting stats with pattern: {pattern}, reset: {reset}")
-            # Placeholder - will be implemented with proper proto files
-            return {}
-        except Exception as e:
-            logger.error(f"Error getting stats: {e}")
-            return {}
+            response = await self._get_stats_stub().QueryStats(
+                stats_command_pb2.QueryStatsRequest(pattern=pattern, reset=reset),
+                timeout=self.timeout
+            )
+            return {stat.name: stat.value for stat in response.stat}
+        except grpc.RpcError as e:
+            logger.error(f"Error getting stats: {e.code()} {e.details()}")
+            return None
     
-    def get_user_stats(self, user_uuid: str) -> Dict[str, int]:
+    async def query_stats_raw(self, pattern: str = "") -> Optional[bytes]:
+        """
+        QueryStats (without reset) with the response left serialized, so a
+        large one can be decoded off the event loop with parse_user_totals.
+        None if the call failed.
+        """
+        if self._query_stats_raw is None:
+            self.connect()
+            self._query_stats_raw = self.channel.unary_unary(
+                "/xray.app.stats.command.StatsService/QueryStats",
+                request_serializer=stats_command_pb2.QueryStatsRequest.SerializeToString,
+                response_deserializer=None,
+            )
+        try:
+            return await self._query_stats_raw(
+                stats_command_pb2.QueryStatsRequest(pattern=pattern),
+                timeout=self.timeout
+            )
+        except grpc.RpcError as e:
+            logger.error(f"Error getting stats: {e.code()} {e.details()}")
+            return None
+    
+    async def get_user_stats(self, user_uuid: str) -> Dict[str, int]:
         """Get traffic stats for a specific user"""
-        stats = {}
-        
-        # Get uplink (bytes sent)
-        uplink_pattern = f"user>>>{user_uuid}>>>traffic>>>uplink"
-        uplink_stats = self.get_stats(uplink_pattern)
-        stats['uplink'] = uplink_stats.get(uplink_pattern, 0)
-        
-        # Get downlink (bytes received)
-        downlink_pattern = f"user>>>{user_uuid}>>>traffic>>>downlink"
-        downlink_stats = self.get_stats(downlink_pattern)
-        stats['downlink'] = downlink_stats.get(downlink_pattern, 0)
+        users_stats = parse_user_traffic(await self.get_stats(f"user>>>{user_uuid}>>>traffic>>>") or {})
+        return users_stats.get(user_uuid, {'uplink': 0, 'downlink': 0, 'total': 0})
+    
+    async def get_all_users_stats(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        """Get traffic stats for all users (keyed by client email, i.e. UUID) in one call"""
+        return parse_user_traffic(await self.get_stats("user>>>", reset=reset) or {})
+    
+    async def get_online_users(self) -> Optional[List[str]]:
+        """
+        Emails (UUIDs) of users with at least one live connection, in one
+        GetAllOnlineUsers call. Needs the statsUserOnline policy.
+        None if Xray is unreachable or too old to support it.
+        """
+        try:
+            response = await self._get_stats_stub().GetAllOnlineUsers(
+                stats_command_pb2.GetAllOnlineUsersRequest(),
+                timeout=self.timeout
+            )
+        except grpc.RpcError as e:
+            logger.warning(f"GetAllOnlineUsers failed: {e.code()} {e.details()}")
+            return None
         
-        stats['total'] = stats['uplink'] + stats['downlink']
-        return stats
-    
-    def get_all_users_stats(self) -> Dict[str, Dict[str, int]]:
-        """Get stats for all users"""
-        # Get all user stats
-        all_stats_pattern = "user>>>"
-        all_stats = self.get_stats(all_stats_pattern)
+        # Names are user>>>{email}>>>online
+        emails = []
+        for name in response.users:
+            parts = name.split(">>>")
+            emails.append(parts[1] if len(parts) == 3 else name)
+        return emails
+    
+    async def get_online_ips(self, email: str) -> Dict[str, int]:
+        """Source IPs of a user's live connections, as {ip: last seen unix time}"""
+        try:
+            response = await self._get_stats_stub().GetStatsOnlineIpList(
+                stats_command_pb2.GetStatsRequest(name=f"user>>>{email}>>>online"),
+                timeout=self.timeout
+            )
+        except grpc.RpcError as e:
+            # NOT_FOUND once the user went offline since the online list was read
+            if e.code() != grpc.StatusCode.NOT_FOUND:
+                logger.warning(f"GetStatsOnlineIpList for {email} failed: {e.code()} {e.details()}")
+            return {}
+        return dict(response.ips)
+    
+    async def get_online_ip_lists(self, emails: List[str]) -> Dict[str, Dict[str, int]]:
+        """IP lists for many users, with a bounded number of concurrent calls"""
+        semaphore = asyncio.Semaphore(ONLINE_IP_CONCURRENCY)
         
-        # Parse and organize by user UUID
-        users_stats = {}
-        for stat_name, value in all_stats.items():
-            if "user>>>" in stat_name and "traffic" in stat_name:
-                parts = stat_name.split(">>>")
-                if len(parts) >= 2:
-                    user_uuid = parts[1]
-                    if user_uuid not in users_stats:
-                        users_stats[user_uuid] = {'uplink': 0, 'downlink': 0, 'total': 0}
-                    
-                    if 'uplink' in stat_name:
-                        users_stats[user_uuid]['uplink'] = value
-                    elif 'downlink' in stat_name:
-                        users_stats[user_uuid]['downlink'] = value
-                    
-                    users_stats[user_uuid]['total'] = (
-                        users_stats[user_uuid]['uplink'] + 
-                        users_stats[user_uuid]['downlink']
-                    )
+        async def fetch(email: str) -> Dict[str, int]:
+            async with semaphore:
+                return await self.get_online_ips(email)
         
-        return users_stats
+        ip_lists = await asyncio.gather(*(fetch(email) for email in emails))
+        return dict(zip(emails, ip_lists))
     
-    def reload_config(self) -> bool:
-        """Reload Xray configuration via HandlerService"""
-        if not self.channel:
-            logger.warning("gRPC channel not connected")
-            return False
-        
+    async def get_sys_stats(self) -> Optional[Dict[str, int]]:
+        """Get Xray runtime stats; None if Xray is unreachable within the deadline"""
+        try:
+            response = await self._get_stats_stub().GetSysStats(
+                stats_command_pb2.SysStatsRequest(),
+                timeout=self.timeout
+            )
+        except grpc.RpcError as e:
+            logger.warning(f"GetSysStats failed: {e.code()} {e.details()}")
+            return None
+        return {
+            "uptime": response.Uptime,
+            "goroutines": response.NumGoroutine,
+            "alloc": response.Alloc,
+        }
+    
+    async def _alter_inbound(self, inbound_tag: str, operation) -> bool:
+        """Send a single AlterInbound operation to HandlerService"""
         try:
-            # Note: This requires Xray proto files
-            # from app.proto import handler_pb2, handler_pb2_grpc
-            # stub = handler_pb2_grpc.HandlerServiceStub(self.channel)
-            # response = stub.AlterInbound(handler_pb2.AlterInboundRequest(...))
-            
-            logger.info("Reloading Xray config via gRPC")
-            # Placeholder - will be implemented with proper proto files
+            await self._get_handler_stub().AlterInbound(
+                handler_command_pb2.AlterInboundRequest(
+                    tag=inbound_tag,
+                    operation=to_typed_message(operation)
+                ),
+                timeout=self.timeout
+            )
             return True
-        except Exception as e:
-            logger.error(f"Error reloading config: {e}")
+        except grpc.RpcError as e:
+            logger.error(f"AlterInbound on {inbound_tag} failed: {e.code()} {e.details()}")
             return False
     
-    def close(self):
-        """Close gRPC connection"""
-        if self.channel:
-            self.channel.close()
-            logger.info("Closed Xray gRPC connection")
-    
-    def __enter__(self):
-        return self
+    async def add_user(self, inbound_tag: str, email: str, user_uuid: str, flow: str = "", level: int = 0) -> bool:
+        """Add a VLESS client to a running inbound via HandlerService"""
+        account = vless_account_pb2.Account(id=user_uuid, flow=flow, encryption="none")
+        operation = handler_command_pb2.AddUserOperation(
+            user=user_pb2.User(
+                level=level,
+                email=email,
+                account=to_typed_message(account)
+            )
+        )
+        return await self._alter_inbound(inbound_tag, operation)
     
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
+    async def remove_user(self, inbound_tag: str, email: str) -> bool:
+        """Remove a client (by email) from a running inbound via HandlerService"""
+        operation = handler_command_pb2.RemoveUserOperation(email=email)
+        return await self._alter_inbound(inbound_tag, operation)
 
 
-# Alternative implementation using log parsing for stats
-# This can be used until proto files are compiled
-class XrayStatsParser:
-    """Parse Xray stats from logs or alternative methods"""
-    
-    @staticmethod
-    def parse_access_log(log_path: str) -> Dict[str, Dict[str, int]]:
-        """Parse access log to extract user traffic stats"""
-        # This would parse Xray access logs
-        # Format: timestamp user_uuid domain bytes_sent bytes_received
-        users_stats = {}
-        
-        try:
-            with open(log_path, 'r') as f:
-                for line in f:
-                    # Parse log line (format depends on Xray log format)
-                    # This is a placeholder implementation
-                    pass
-        except Exception as e:
-            logger.error(f"Error parsing access log: {e}")
-        
-        return users_stats
+# Shared app-lifetime client: connected on startup, closed on shutdown
+xray_grpc = XrayGRPCClient()
 
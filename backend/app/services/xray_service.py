@@ -1,20 +1,230 @@
+import asyncio
+import copy
 import json
 import grpc
 import os
-from typing import List, Dict, Optional
+import threading
+import uuid
+import hashlib
+import aiofiles
+import aiofiles.os
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.models import User, XrayConfig
 from app.services.reality_service import RealityService
 from app.services.routing_service import RoutingService
 from app.config import settings
+from app.utils.serialization import dumps_compact
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Note: Xray gRPC proto files need to be compiled
-# For now, we'll use JSON-based config management
-# gRPC integration can be added later with proper proto compilation
+# The on-disk JSON config is the source of truth for Xray restarts.
+# Single client changes are pushed to the running inbound through
+# HandlerService so they don't require a restart.
+
+CLIENT_FLOW = "xtls-rprx-vision"
+
+TEMPLATE_PATH = Path(__file__).parent.parent.parent.parent / "xray" / "config.json.template"
+
+DEFAULT_CONFIG = {
+    "log": {
+        "loglevel": "warning",
+        "access": "/var/log/xray/access.log",
+        "error": "/var/log/xray/error.log"
+    },
+    "stats": {},
+    "api": {
+        "tag": "api",
+        "services": ["StatsService", "HandlerService"]
+    },
+    "policy": {
+        "levels": {
+            "0": {
+                "statsUserUplink": True,
+                "statsUserDownlink": True,
+                # Per-user online connections and IPs (GetAllOnlineUsers)
+                "statsUserOnline": True
+            }
+        }
+    },
+    "inbounds": [{
+        "tag": "vless-reality",
+        "port": 443,
+        "protocol": "vless",
+        "settings": {
+            "clients": [],
+            "decryption": "none"
+        },
+        "streamSettings": {
+            "network": "tcp",
+            "security": "reality",
+            "realitySettings": {},
+            "sockopt": {
+                "tcpFastOpen": True
+            }
+        },
+        "fragment": {
+            "packets": "tlshello",
+            "length": "100-200",
+            "interval": "10-20"
+        }
+    }],
+    "outbounds": [
+        {"protocol": "freedom", "tag": "direct"},
+        {"protocol": "blackhole", "tag": "blocked"}
+    ],
+    "routing": {
+        "domainStrategy": "IPIfNonMatch",
+        "rules": []
+    }
+}
+
+
+# Parsed template shared by the whole process, keyed by the file's (mtime, size)
+_template_cache = {"key": None, "config": None}
+_template_lock = threading.Lock()
+
+
+def get_cached_template() -> Optional[Dict]:
+    """
+    Get the parsed config template, re-reading the file only when its
+    mtime or size changed. Returns None if the template does not exist.
+    The returned dict is shared: copy before mutating.
+    """
+    try:
+        stat = TEMPLATE_PATH.stat()
+    except FileNotFoundError:
+        if _template_cache["key"] != "missing":
+            logger.warning("Template not found, using default config")
+            _template_cache["key"] = "missing"
+            _template_cache["config"] = None
+        return None
+    
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _template_lock:
+        if _template_cache["key"] != key:
+            with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+                _template_cache["config"] = json.load(f)
+            _template_cache["key"] = key
+            logger.info(f"Loaded Xray config template from {TEMPLATE_PATH}")
+        return _template_cache["config"]
+
+
+# Compact emission: clients are streamed in chunks of this many entries
+CLIENT_CHUNK_SIZE = 2000
+WRITE_BUFFER_SIZE = 1024 * 1024
+_CLIENTS_PLACEHOLDER = "__rootitvpn_clients_{}__"
+
+# Fragment files written when xray_confdir is set, in Xray's merge order.
+# Xray replaces an inbound with the same tag wholesale when merging files, so
+# the clients cannot be split off their inbound: Reality settings and clients
+# share the inbounds fragment. Keys None marks the file for everything else.
+CONFDIR_FRAGMENTS = [
+    ("00_base.json", None),
+    ("01_api.json", ["api", "stats", "policy"]),
+    ("02_routing.json", ["routing"]),
+    ("03_outbounds.json", ["outbounds"]),
+    ("10_inbounds.json", ["inbounds"]),
+]
+
+
+def iter_json_array(items: Iterable, chunk_size: int = CLIENT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream a JSON array chunk by chunk, never holding the whole text"""
+    yield b"["
+    items = iter(items)
+    first = True
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        body = dumps_compact(chunk)[1:-1]  # Strip the chunk's own brackets
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def iter_config_chunks(config: Dict, pretty: bool = False) -> Iterator[bytes]:
+    """
+    Serialize an Xray config as a stream of byte chunks.
+    pretty: indented output built in one piece (for reading the file by hand)
+    Otherwise the config is compact and every inbound's clients list is
+    streamed in chunks, so the full text is never built in memory.
+    """
+    if pretty:
+        # default=list materializes streamed client lists (ActiveClients)
+        yield json.dumps(config, indent=2, ensure_ascii=False, default=list).encode("utf-8")
+        return
+    
+    # Serialize everything except the clients with placeholders in their place
+    client_lists = []
+    skeleton = dict(config)
+    if config.get("inbounds"):
+        inbounds = []
+        for inbound in config["inbounds"]:
+            if _has_clients(inbound):
+                placeholder = _CLIENTS_PLACEHOLDER.format(len(client_lists))
+                client_lists.append(inbound["settings"]["clients"])
+                inbound = _with_clients(inbound, placeholder)
+            inbounds.append(inbound)
+        skeleton["inbounds"] = inbounds
+    rest = dumps_compact(skeleton)
+    
+    for index, clients in enumerate(client_lists):
+        marker = dumps_compact(_CLIENTS_PLACEHOLDER.format(index))
+        head, rest = rest.split(marker, 1)
+        yield head
+        yield from iter_json_array(clients)
+    yield rest
+
+
+def _has_clients(inbound: Dict) -> bool:
+    return "clients" in inbound.get("settings", {})
+
+
+def _with_clients(inbound: Dict, clients) -> Dict:
+    inbound = dict(inbound)
+    inbound["settings"] = dict(inbound["settings"])
+    inbound["settings"]["clients"] = clients
+    return inbound
+
+
+def build_client_config(user_uuid: str) -> Dict:
+    """Build Xray client config for a user UUID"""
+    # Clients are keyed by UUID: stats counters are named
+    # user>>>{email}>>>... and RemoveUserOperation matches on email,
+    # so the key must not change when a user is renamed.
+    return {
+        "id": user_uuid,
+        "email": user_uuid,
+        "flow": CLIENT_FLOW
+    }
+
+
+class ActiveClients:
+    """
+    Client configs of all active users, streamed from the database.
+    Only the uuid column is selected and rows are fetched in batches
+    (yield_per, a server-side cursor where the driver supports it), so
+    no ORM objects are built and memory stays flat as the table grows.
+    Each iteration runs a fresh query.
+    """
+    
+    def __init__(self, db: Session, batch_size: int = CLIENT_CHUNK_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+    
+    def __iter__(self) -> Iterator[Dict]:
+        rows = self.db.execute(
+            select(User.uuid)
+            .where(User.is_active == True)
+            .execution_options(yield_per=self.batch_size)
+        )
+        for (user_uuid,) in rows:
+            yield build_client_config(user_uuid)
 
 
 class XrayService:
@@ -22,78 +232,63 @@ class XrayService:
         self.reality_service = reality_service
         self.routing_service = routing_service
         self.config_path = Path(settings.xray_config_path)
+        # Set by save_config: True if the config was identical to the applied one
+        self.last_write_skipped = False
     
     def load_config_template(self) -> Dict:
-        """Load Xray config template"""
-        template_path = Path(__file__).parent.parent.parent.parent / "xray" / "config.json.template"
-        
-        if not template_path.exists():
-            logger.warning("Template not found, using default config")
+        """Load Xray config template (a private copy of the cached parse)"""
+        template = get_cached_template()
+        if template is None:
             return self.get_default_config()
-        
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return copy.deepcopy(template)
     
     def get_default_config(self) -> Dict:
         """Get default Xray config"""
-        return {
-            "log": {
-                "loglevel": "warning",
-                "access": "/var/log/xray/access.log",
-                "error": "/var/log/xray/error.log"
-            },
-            "stats": {},
-            "api": {
-                "tag": "api",
-                "services": ["StatsService", "HandlerService"]
-            },
-            "inbounds": [{
-                "tag": "vless-reality",
-                "port": 443,
-                "protocol": "vless",
-                "settings": {
-                    "clients": [],
-                    "decryption": "none"
-                },
-                "streamSettings": {
-                    "network": "tcp",
-                    "security": "reality",
-                    "realitySettings": {},
-                    "sockopt": {
-                        "tcpFastOpen": True
-                    }
-                },
-                "fragment": {
-                    "packets": "tlshello",
-                    "length": "100-200",
-                    "interval": "10-20"
-                }
-            }],
-            "outbounds": [
-                {"protocol": "freedom", "tag": "direct"},
-                {"protocol": "blackhole", "tag": "blocked"}
-            ],
-            "routing": {
-                "domainStrategy": "IPIfNonMatch",
-                "rules": []
-            }
-        }
+        return copy.deepcopy(DEFAULT_CONFIG)
+    
+    def _config_view(self) -> Dict:
+        """
+        Copy-on-write view of the template for generate_config.
+        Only the containers generate_config replaces are copied; everything
+        else is shared with the cache and must not be mutated.
+        """
+        template = get_cached_template()
+        if template is None:
+            template = DEFAULT_CONFIG
+        
+        config = dict(template)
+        if template.get("inbounds"):
+            inbounds = []
+            for inbound in template["inbounds"]:
+                if inbound.get("protocol") == "vless":
+                    inbound = dict(inbound)
+                    inbound["settings"] = dict(inbound.get("settings", {}))
+                    if "streamSettings" in inbound:
+                        inbound["streamSettings"] = dict(inbound["streamSettings"])
+                inbounds.append(inbound)
+            config["inbounds"] = inbounds
+        return config
     
     def build_user_client_config(self, user: User) -> Dict:
         """Build Xray client config for a user"""
-        return {
-            "id": user.uuid,
-            "email": user.username,
-            "flow": "xtls-rprx-vision"
-        }
+        return build_client_config(user.uuid)
     
     def generate_config(self, users: List[User]) -> Dict:
         """Generate complete Xray config with all users"""
-        config = self.load_config_template()
-        reality_settings = self.reality_service.get_current_settings()
-        
-        # Build clients list
         clients = [self.build_user_client_config(user) for user in users if user.is_active]
+        return self._build_config(clients)
+    
+    def generate_config_streamed(self, db: Session) -> Dict:
+        """
+        Generate complete Xray config with clients streamed from the database.
+        The clients list is an ActiveClients iterable that is only read while
+        the config is serialized (see save_config).
+        """
+        return self._build_config(ActiveClients(db))
+    
+    def _build_config(self, clients: Iterable[Dict]) -> Dict:
+        config = self._config_view()
+        reality_settings = self.reality_service.get_current_settings()
         
         # Update inbound settings
         if config.get("inbounds"):
@@ -116,52 +311,238 @@ class XrayService:
         
         return config
     
-    def save_config(self, config: Dict) -> bool:
-        """Save Xray config to file"""
+    def iter_config_chunks(self, config: Dict) -> Iterator[bytes]:
+        """Serialize config in the configured emission mode"""
+        return iter_config_chunks(config, pretty=settings.xray_config_pretty)
+    
+    def config_files(self, config: Dict) -> List[Tuple[Path, Dict]]:
+        """
+        Files to write for a config: the single config file, or one fragment
+        per CONFDIR_FRAGMENTS entry when xray_confdir is set.
+        """
+        if not settings.xray_confdir:
+            return [(self.config_path, config)]
+        
+        confdir = Path(settings.xray_confdir)
+        remaining = dict(config)
+        files = []
+        for name, keys in CONFDIR_FRAGMENTS:
+            if keys is None:
+                continue
+            fragment = {key: remaining.pop(key) for key in keys if key in remaining}
+            if fragment:
+                files.append((confdir / name, fragment))
+        # Everything not claimed by a fragment (dns, transport, ...) goes to the base file
+        base_name = next(name for name, keys in CONFDIR_FRAGMENTS if keys is None)
+        files.insert(0, (confdir / base_name, remaining))
+        return files
+    
+    def _applied_files(self) -> Dict:
+        """Hashes of the files written last time, keyed by path"""
+        stored = self.reality_service.get_or_create_config().current_config_json
+        if not stored:
+            return {}
+        try:
+            return json.loads(stored).get("files", {})
+        except (ValueError, AttributeError):
+            return {}
+    
+    def _is_applied(self, path: Path, digest: str) -> bool:
+        """
+        Check whether the file already holds the content with this hash: it
+        was written with this hash and its size and mtime are still the ones
+        recorded then, so a file replaced outside the app is rewritten
+        """
+        applied = self._applied_files().get(str(path))
+        if not applied or applied.get("sha256") != digest:
+            return False
         try:
-            # Ensure directory exists
-            self.config_path.parent.mkdir(parents=True, exist_ok=True)
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        return stat.st_size == applied.get("size") and stat.st_mtime_ns == applied.get("mtime_ns")
+    
+    def _record_applied(self, path: Path, digest: str, size: int):
+        """Remember the hash, size and mtime of a file written to disk"""
+        db_config = self.reality_service.get_or_create_config()
+        files = self._applied_files()
+        files[str(path)] = {"sha256": digest, "size": size, "mtime_ns": path.stat().st_mtime_ns}
+        db_config.current_config_json = json.dumps({"files": files})
+        self.reality_service.db.commit()
+    
+    def _temp_path(self, path: Path) -> Path:
+        """Temp file next to the target so the final rename stays on one filesystem"""
+        return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    
+    def _fsync_dir(self, directory: Path):
+        """Persist the rename itself"""
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    def _write_file(self, path: Path, content: Dict) -> bool:
+        """
+        Write one config file atomically (temp file + fsync + rename).
+        The content is streamed to the temp file while it is hashed; if the
+        same content was already applied, the temp file is dropped and the
+        live file is left alone. Returns True if the file changed.
+        """
+        tmp_path = self._temp_path(path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
             
-            # Write config
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            digest = hashlib.sha256()
+            size = 0
+            with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                for chunk in self.iter_config_chunks(content):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                
+                if self._is_applied(path, digest.hexdigest()):
+                    return False
+                
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self._fsync_dir(path.parent)
             
-            logger.info(f"Xray config saved to {self.config_path}")
+            self._record_applied(path, digest.hexdigest(), size)
+            logger.info(f"Xray config saved to {path} ({size} bytes)")
+            return True
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    
+    async def _write_file_async(self, path: Path, content: Dict) -> bool:
+        """Same as _write_file, without blocking the event loop on serialization, file I/O or the database"""
+        from starlette.concurrency import run_in_threadpool
+        
+        tmp_path = self._temp_path(path)
+        try:
+            await aiofiles.os.makedirs(path.parent, exist_ok=True)
+            
+            chunks = self.iter_config_chunks(content)
+            digest = hashlib.sha256()
+            size = 0
+            async with aiofiles.open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                while True:
+                    chunk = await run_in_threadpool(next, chunks, None)
+                    if chunk is None:
+                        break
+                    digest.update(chunk)
+                    await f.write(chunk)
+                    size += len(chunk)
+                
+                if await run_in_threadpool(self._is_applied, path, digest.hexdigest()):
+                    return False
+                
+                await f.flush()
+                await run_in_threadpool(os.fsync, f.fileno())
+            await aiofiles.os.replace(tmp_path, path)
+            await run_in_threadpool(self._fsync_dir, path.parent)
+            
+            await run_in_threadpool(self._record_applied, path, digest.hexdigest(), size)
+            logger.info(f"Xray config saved to {path} ({size} bytes)")
+            return True
+        finally:
+            if await aiofiles.os.path.exists(tmp_path):
+                await aiofiles.os.remove(tmp_path)
+    
+    def save_config(self, config: Dict) -> bool:
+        """
+        Save Xray config to file(s) atomically.
+        Unchanged files are not rewritten; last_write_skipped is set if
+        nothing changed at all.
+        """
+        try:
+            changed = [self._write_file(path, content) for path, content in self.config_files(config)]
+            self.last_write_skipped = not any(changed)
+            if self.last_write_skipped:
+                logger.info("Xray config unchanged, skipping write")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving Xray config: {e}")
+            return False
+    
+    async def save_config_async(self, config: Dict) -> bool:
+        """Same as save_config, without blocking the event loop on serialization or file I/O"""
+        try:
+            changed = [
+                await self._write_file_async(path, content)
+                for path, content in self.config_files(config)
+            ]
+            self.last_write_skipped = not any(changed)
+            if self.last_write_skipped:
+                logger.info("Xray config unchanged, skipping write")
             return True
         except Exception as e:
             logger.error(f"Error saving Xray config: {e}")
             return False
     
+    def config_exists(self) -> bool:
+        """Check whether a config has been written (the inbounds fragment in confdir mode)"""
+        if settings.xray_confdir:
+            return (Path(settings.xray_confdir) / CONFDIR_FRAGMENTS[-1][0]).exists()
+        return self.config_path.exists()
+    
     def ensure_config_exists(self, db: Session) -> bool:
         """Ensure Xray config file exists, create if not"""
-        if self.config_path.exists():
+        if self.config_exists():
             return True
         
         try:
             # Generate config with current users
-            from app.models import User
-            users = db.query(User).filter(User.is_active == True).all()
-            config = self.generate_config(users)
+            config = self.generate_config_streamed(db)
             return self.save_config(config)
         except Exception as e:
             logger.error(f"Error ensuring config exists: {e}")
             return False
     
-    def reload_config(self) -> bool:
-        """Reload Xray config using gRPC or docker restart"""
+    async def apply_client_changes(self, added: List[Dict] = None, removed: List[str] = None) -> bool:
+        """
+        Push client changes to the running Xray inbound via HandlerService.
+        added: client configs from build_user_client_config
+        removed: client emails
+        Calls go out concurrently over the shared gRPC channel.
+        Returns True only if every operation succeeded; the caller should then
+        fall back to a config rewrite plus restart.
+        """
+        added = added or []
+        removed = removed or []
+        if not added and not removed:
+            return True
+        
         try:
-            # Try using gRPC first
-            from app.services.xray_grpc_client import XrayGRPCClient
-            client = XrayGRPCClient()
-            if client.reload_config():
-                logger.info("Xray config reloaded via gRPC")
-                client.close()
-                return True
-            client.close()
+            from app.services.xray_grpc_client import xray_grpc
+            tag = settings.xray_inbound_tag
+            results = await asyncio.gather(*[
+                xray_grpc.remove_user(tag, email) for email in removed
+            ])
+            results += await asyncio.gather(*[
+                xray_grpc.add_user(
+                    tag,
+                    client_config["email"],
+                    client_config["id"],
+                    flow=client_config.get("flow", "")
+                )
+                for client_config in added
+            ])
+            ok = all(results)
+            if ok:
+                logger.info(f"Applied Xray client changes via gRPC: +{len(added)} -{len(removed)}")
+            return ok
         except Exception as e:
-            logger.warning(f"gRPC reload failed: {e}, trying docker restart")
-        
-        # Fallback: Restart Xray container via docker
+            logger.warning(f"gRPC client update failed: {e}")
+            return False
+    
+    def reload_config(self) -> bool:
+        """Reload Xray config by restarting the container (Xray has no config reload RPC)"""
         try:
             import subprocess
             result = subprocess.run(
@@ -0,0 +1,2 @@
+# Command-line tools package
+
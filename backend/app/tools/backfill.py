@@ -0,0 +1,188 @@
+"""
+Offline access log backfill
+Imports rotated (optionally gzipped) Xray access logs into access_logs.
+Plain files are split into line-aligned byte ranges and gzipped files are
+taken whole; a process pool parses them into batches and this process is
+the single writer that maps emails to users and inserts them.
+
+Lines already stored by the live ingester are not detected; use --since and
+--until to import only the missing time range.
+
+Usage (from the backend directory):
+    python -m app.tools.backfill [files ...] [--workers N] [--since 2024-05-01T00:00]
+Without files, {log_path}/access.log.* is imported.
+"""
+import argparse
+import glob
+import gzip
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.utils.access_log import AccessLogParser
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024 * 1024  # Bytes of a plain file per task
+BATCH_SIZE = 10000  # Parsed lines per batch sent to the writer
+
+# Set in each worker by _init_worker
+_queue = None
+
+Task = Tuple[str, int, Optional[int]]  # (path, start offset, end offset or None for the whole file)
+
+
+def plan_tasks(paths: List[str], chunk_size: int = CHUNK_SIZE) -> List[Task]:
+    """Split plain files into byte ranges; gzipped files cannot be split"""
+    tasks = []
+    for path in paths:
+        if path.endswith(".gz"):
+            tasks.append((path, 0, None))
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), chunk_size):
+            tasks.append((path, start, min(start + chunk_size, size)))
+    # Largest first, so a big gzipped file does not start last
+    tasks.sort(key=lambda task: -(os.path.getsize(task[0]) if task[2] is None else task[2] - task[1]))
+    return tasks
+
+
+def _iter_lines(path: str, start: int, end: Optional[int]):
+    """Lines whose first byte lies in [start, end)"""
+    if end is None:
+        with gzip.open(path, "rb") as f:
+            yield from f
+        return
+    
+    with open(path, "rb") as f:
+        if start:
+            # Skip the line that began in the previous range
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def _init_worker(queue):
+    global _queue
+    _queue = queue
+
+
+def parse_task(task: Task, since: Optional[datetime], until: Optional[datetime]):
+    """Worker: parse one task and send (timestamp, email, domain) batches to the writer"""
+    parse = AccessLogParser().parse
+    lines = 0
+    batch = []
+    try:
+        for line in _iter_lines(*task):
+            lines += 1
+            parsed = parse(line.decode("utf-8", "replace"))
+            if parsed is None:
+                continue
+            if (since and parsed[0] < since) or (until and parsed[0] >= until):
+                continue
+            batch.append(parsed)
+            if len(batch) >= BATCH_SIZE:
+                _queue.put(("rows", batch))
+                batch = []
+        if batch:
+            _queue.put(("rows", batch))
+        _queue.put(("done", lines, None))
+    except Exception as e:
+        _queue.put(("done", lines, f"{task[0]}: {e}"))
+
+
+def backfill(paths: List[str], workers: int, since: datetime = None, until: datetime = None) -> dict:
+    """Import the given files; returns line/row counts and timings"""
+    from app.database import SessionLocal, init_db
+    from app.services.access_log_service import AccessLogWriter
+    
+    init_db()
+    tasks = plan_tasks(paths)
+    context = multiprocessing.get_context()
+    # Bounded, so parsing workers wait for the writer instead of filling memory
+    queue = context.Queue(maxsize=workers * 4)
+    
+    db = SessionLocal()
+    writer = AccessLogWriter()
+    stats = {"files": len(paths), "tasks": len(tasks), "lines": 0, "parsed": 0, "stored": 0, "errors": []}
+    started = last_report = time.perf_counter()
+    try:
+        with context.Pool(workers, initializer=_init_worker, initargs=(queue,)) as pool:
+            for task in tasks:
+                pool.apply_async(parse_task, (task, since, until))
+            
+            remaining = len(tasks)
+            while remaining:
+                message = queue.get()
+                if message[0] == "done":
+                    remaining -= 1
+                    stats["lines"] += message[1]
+                    if message[2]:
+                        stats["errors"].append(message[2])
+                        logger.error(f"Backfill task failed: {message[2]}")
+                    continue
+                
+                batch = message[1]
+                stats["parsed"] += len(batch)
+                records = []
+                for timestamp, email, domain in batch:
+                    user_key = writer.user_key(db, email)
+                    if user_key is not None:
+                        records.append((timestamp, user_key, domain))
+                stats["stored"] += writer.write(db, records)
+                db.commit()
+                
+                now = time.perf_counter()
+                if now - last_report >= 5:
+                    last_report = now
+                    logger.info(
+                        f"Backfill: {stats['parsed']} lines parsed, {stats['stored']} stored, "
+                        f"{stats['parsed'] / (now - started):,.0f} lines/s"
+                    )
+    finally:
+        db.close()
+    
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def default_paths() -> List[str]:
+    return sorted(glob.glob(str(Path(settings.log_path) / "access.log.*")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Log files (plain or .gz)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Skip lines before this time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Skip lines at or after this time")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    paths = args.files or default_paths()
+    if not paths:
+        parser.error(f"No access.log.* files in {settings.log_path}")
+    
+    stats = backfill(paths, max(args.workers, 1), args.since, args.until)
+    seconds = stats["seconds"]
+    print(
+        f"{stats['files']} files in {stats['tasks']} tasks: {stats['lines']} lines read, "
+        f"{stats['parsed']} accepted, {stats['stored']} stored in {seconds:.2f}s "
+        f"({stats['lines'] / seconds:,.0f} lines/s)"
+    )
+    if stats["errors"]:
+        raise SystemExit(f"{len(stats['errors'])} task(s) failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Synthetic Xray access log generator, for benchmarking the ingester and backfill.
+
+Client emails are deterministic UUIDs (uuid.UUID(int=i)), so --create-users
+can add matching users to the configured database.
+
+Usage (from the backend directory):
+    python -m app.tools.gen_access_log /tmp/logs/access.log --lines 1000000 --files 4 --gzip --create-users
+"""
+import argparse
+import gzip
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+DOMAINS = [
+    "www.google.com", "rr3---sn-4g5e6nz7.googlevideo.com", "rr5---sn-q4fl6nsr.googlevideo.com",
+    "api.telegram.org", "www.instagram.com", "scontent.cdninstagram.com", "i.ytimg.com",
+    "graph.facebook.com", "github.com", "web.whatsapp.com", "update.microsoft.com",
+    "cdn.discordapp.com", "www.wikipedia.org", "api.twitter.com", "www.netflix.com",
+]
+
+
+def user_uuids(users: int) -> List[str]:
+    return [str(uuid.UUID(int=i)) for i in range(users)]
+
+
+def write_log(path: str, lines: int, emails: List[str], start: datetime = None, compress: bool = False, seed: int = 0):
+    """Write lines in Xray's access log format, 5 ms apart from start"""
+    rng = random.Random(seed)
+    start = start or datetime(2024, 5, 1)
+    opener = gzip.open if compress else open
+    with opener(path, "wt") as f:
+        for i in range(lines):
+            ts = (start + timedelta(milliseconds=i * 5)).strftime("%Y/%m/%d %H:%M:%S.%f")
+            network = "udp" if i % 10 == 0 else "tcp"
+            f.write(
+                f"{ts} from 10.{i % 200}.{i % 250}.{i % 240}:{40000 + i % 20000} accepted "
+                f"{network}:{rng.choice(DOMAINS)}:443 [vless-reality -> direct] email: {rng.choice(emails)}\n"
+            )
+
+
+def create_users(emails: List[str]) -> int:
+    """Insert users for the generated emails that do not exist yet"""
+    from sqlalchemy import insert, select
+    from app.database import SessionLocal, init_db
+    from app.models import User
+    
+    init_db()
+    db = SessionLocal()
+    try:
+        existing = set(db.scalars(select(User.uuid).where(User.uuid.in_(emails))))
+        rows = [
+            {"id": str(uuid.uuid4()), "username": f"bench-{email}", "uuid": email, "data_limit": 0, "data_used": 0}
+            for email in emails
+            if email not in existing
+        ]
+        if rows:
+            db.execute(insert(User.__table__), rows)
+            db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Log file to write; with --files N, rotated files get .1 .. .N-1 suffixes")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Lines per file")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--gzip", action="store_true", help="Compress the rotated files (.N.gz)")
+    parser.add_argument("--create-users", action="store_true", help="Add matching users to the database")
+    args = parser.parse_args()
+    
+    emails = user_uuids(args.users)
+    start = datetime(2024, 5, 1)
+    for index in range(args.files):
+        # Oldest file gets the highest suffix, like logrotate
+        age = args.files - 1 - index
+        path = args.path if age == 0 else f"{args.path}.{age}{'.gz' if args.gzip else ''}"
+        write_log(path, args.lines, emails, start=start, compress=args.gzip and age > 0, seed=index)
+        start += timedelta(milliseconds=args.lines * 5)
+        print(f"Wrote {args.lines} lines to {path}")
+    
+    if args.create_users:
+        print(f"Created {create_users(emails)} users")
+
+
+if __name__ == "__main__":
+    main()
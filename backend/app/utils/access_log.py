@@ -0,0 +1,50 @@
+"""
+Xray access log parsing
+Lines look like (the "from " prefix and millisecond part depend on the Xray version):
+    2024/05/01 12:00:00.123456 from 1.2.3.4:5678 accepted tcp:www.google.com:443 [vless-reality -> direct] email: <uuid>
+Only accepted connections of known clients (with an email) are kept.
+"""
+import re
+from datetime import datetime
+from typing import Optional, Tuple
+
+LINE_RE = re.compile(
+    r"(\d{4})/(\d\d)/(\d\d) (\d\d):(\d\d):(\d\d)\S* (?:from )?\S+ accepted "
+    r"(?:tcp:|udp:)?(\S+) .*?email: (\S+)"
+)
+
+
+def split_host(destination: str) -> str:
+    """Host part of host:port, [v6]:port or a bare host"""
+    if destination.startswith("["):
+        return destination[1:destination.find("]")]
+    host, sep, port = destination.rpartition(":")
+    return host if sep and port.isdigit() else destination
+
+
+def reverse_labels(domain: str) -> str:
+    """Domain with its labels in reverse order: rr1.googlevideo.com -> com.googlevideo.rr1"""
+    return ".".join(reversed(domain.split(".")))
+
+
+class AccessLogParser:
+    """Precompiled access log line parser; timestamps are cached per second"""
+    
+    def __init__(self):
+        self._second = None
+        self._timestamp = None
+    
+    def parse(self, line: str) -> Optional[Tuple[datetime, str, str]]:
+        """(timestamp, email, domain) of an accepted connection, or None"""
+        match = LINE_RE.match(line)
+        if match is None:
+            return None
+        
+        # Consecutive lines mostly share the same second
+        second = line[:19]
+        if second != self._second:
+            year, month, day, hour, minute, sec = match.group(1, 2, 3, 4, 5, 6)
+            self._timestamp = datetime(int(year), int(month), int(day), int(hour), int(minute), int(sec))
+            self._second = second
+        
+        return self._timestamp, match.group(8), split_host(match.group(7)).lower()
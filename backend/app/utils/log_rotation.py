@@ -7,9 +7,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Files Xray is writing to
+LIVE_LOGS = ("access.log", "error.log")
+
 
 def rotate_logs():
-    """Delete log files older than retention period"""
+    """Delete log files older than retention period, truncating the ones Xray writes to"""
     log_path = Path(settings.log_path)
     retention_hours = settings.log_retention_hours
     cutoff_time = datetime.now() - timedelta(hours=retention_hours)
@@ -19,6 +22,7 @@ def rotate_logs():
         return
     
     deleted_count = 0
+    truncated_count = 0
     total_size_freed = 0
     
     # Find all log files
@@ -36,18 +40,25 @@ def rotate_logs():
                 
                 if mtime < cutoff_time:
                     file_size = log_file.stat().st_size
-                    log_file.unlink()
-                    deleted_count += 1
+                    if log_file.name in LIVE_LOGS:
+                        # Xray keeps these open for appending; truncate so it keeps
+                        # writing to the same file (the ingester re-reads from the start)
+                        os.truncate(log_file, 0)
+                        truncated_count += 1
+                        logger.info(f"Truncated old log file: {log_file.name} ({file_size} bytes)")
+                    else:
+                        log_file.unlink()
+                        deleted_count += 1
+                        logger.info(f"Deleted old log file: {log_file.name} ({file_size} bytes)")
                     total_size_freed += file_size
-                    logger.info(f"Deleted old log file: {log_file.name} ({file_size} bytes)")
             except Exception as e:
                 logger.error(f"Error deleting log file {log_file}: {e}")
     
-    logger.info(f"Log rotation completed: {deleted_count} files deleted, {total_size_freed / 1024 / 1024:.2f} MB freed")
+    logger.info(f"Log rotation completed: {deleted_count} files deleted, {truncated_count} truncated, {total_size_freed / 1024 / 1024:.2f} MB freed")
 
 
 def clean_access_logs_db(db):
-    """Clean old access logs from database"""
+    """Clean old access logs and hourly domain stats from database"""
     from app.models import AccessLog
     from datetime import datetime, timedelta
     
@@ -60,9 +71,15 @@ def clean_access_logs_db(db):
         ).delete()
         db.commit()
         logger.info(f"Deleted {deleted_count} old access log records from database")
-        return deleted_count
     except Exception as e:
         db.rollback()
         logger.error(f"Error cleaning access logs from database: {e}")
         return 0
+    
+    try:
+        from app.services.domain_stats_service import DomainStatsService
+        DomainStatsService(db).prune(timedelta(days=settings.domain_stats_retention_days))
+    except Exception as e:
+        logger.error(f"Error cleaning domain stats from database: {e}")
+    return deleted_count
 
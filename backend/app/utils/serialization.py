@@ -0,0 +1,25 @@
+"""
+Compact JSON serialization
+Shared by the config writer and the API endpoints that return
+pre-serialized bodies (monitoring, NDJSON exports).
+"""
+import json
+try:
+    import orjson
+except ImportError:  # Optional, stdlib json is used otherwise
+    orjson = None
+from datetime import datetime
+
+
+def _json_default(obj):
+    # orjson writes datetimes natively, in the same ISO format
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_compact(obj) -> bytes:
+    """Compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode("utf-8")
@@ -0,0 +1,151 @@
+"""
+Benchmark access log storage: legacy vs compact schema.
+
+Fills a temporary SQLite database with N rows in the legacy access_logs
+layout (UUID string keys, inline domain, four indexes), measures its size
+(dbstat) and the /monitoring/access-logs queries, then runs init_db(),
+which migrates the rows to the compact layout, and measures again.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_access_log_storage [--rows 1000000] [--users 1000] [--domains 5000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+LEGACY_DDL = [
+    "CREATE TABLE access_logs (id VARCHAR NOT NULL, user_id VARCHAR NOT NULL, domain VARCHAR, "
+    "bytes_sent BIGINT, bytes_received BIGINT, timestamp DATETIME, PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES users (id))",
+    "CREATE INDEX ix_access_logs_user_id ON access_logs (user_id)",
+    "CREATE INDEX ix_access_logs_domain ON access_logs (domain)",
+    "CREATE INDEX ix_access_logs_timestamp ON access_logs (timestamp)",
+]
+
+
+def legacy_recent(conn, table, user_id: str = None, domain: str = None):
+    """The pre-migration /monitoring/access-logs query, returning dicts like AccessLogService.recent"""
+    from sqlalchemy import select
+    query = select(table)
+    if user_id:
+        query = query.where(table.c.user_id == user_id)
+    if domain:
+        query = query.where(table.c.domain.contains(domain))
+    rows = conn.execute(query.order_by(table.c.timestamp.desc()).limit(100)).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def table_sizes(conn, tables):
+    """Bytes used by each table including its indexes"""
+    rows = conn.exec_driver_sql(
+        "SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name GROUP BY m.tbl_name"
+    ).all()
+    return {name: size for name, size in rows if name in tables}
+
+
+def vacuum(engine):
+    """Rebuild the file so sizes do not include free pages"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+
+
+def timed(fn, repeat: int = 20) -> float:
+    """Median milliseconds of fn()"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--domains", type=int, default=5000)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    
+    from sqlalchemy import MetaData, Table, select
+    from app.database import SessionLocal, engine, init_db
+    from app.models import User
+    from app.services.access_log_service import AccessLogService
+    from app.tools.gen_access_log import DOMAINS, create_users, user_uuids
+    
+    create_users(user_uuids(args.users))
+    with engine.begin() as conn:
+        user_ids = list(conn.execute(select(User.id)).scalars())
+        # Start over from the pre-migration layout
+        conn.exec_driver_sql("DROP TABLE access_logs")
+        for ddl in LEGACY_DDL:
+            conn.exec_driver_sql(ddl)
+    
+    rng = random.Random(0)
+    # Half the visits go to a few popular domains, the rest to a long tail
+    tail = [f"s{i}.cdn{i % 97}.example.com" for i in range(max(args.domains - len(DOMAINS), 1))]
+    domains = DOMAINS + tail
+    start = datetime(2024, 5, 1)
+    rows = [
+        (
+            str(uuid.uuid4()), rng.choice(user_ids), rng.choice(DOMAINS if i % 2 else tail),
+            0, 0, start + timedelta(milliseconds=i * 5),
+        )
+        for i in range(args.rows)
+    ]
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO access_logs VALUES (?, ?, ?, ?, ?, ?)", rows)
+    del rows
+    vacuum(engine)
+    
+    user_id = user_ids[0]
+    rare_domain = tail[-1]
+    with engine.connect() as conn:
+        legacy_sizes = table_sizes(conn, {"access_logs"})
+        table = Table("access_logs", MetaData(), autoload_with=conn)
+        legacy_times = {
+            "latest": timed(lambda: legacy_recent(conn, table)),
+            "by user": timed(lambda: legacy_recent(conn, table, user_id=user_id)),
+            "popular domain": timed(lambda: legacy_recent(conn, table, domain="googlevideo")),
+            "rare domain": timed(lambda: legacy_recent(conn, table, domain=rare_domain), repeat=3),
+        }
+    
+    started = time.perf_counter()
+    init_db()
+    migrate_seconds = time.perf_counter() - started
+    vacuum(engine)
+    
+    with engine.connect() as conn:
+        compact_sizes = table_sizes(conn, {"access_logs", "domains", "user_keys"})
+    db = SessionLocal()
+    service = AccessLogService(db)
+    compact_times = {
+        "latest": timed(lambda: service.recent()),
+        "by user": timed(lambda: service.recent(user_id=user_id)),
+        "popular domain": timed(lambda: service.recent(domain="googlevideo")),
+        "rare domain": timed(lambda: service.recent(domain=rare_domain)),
+    }
+    db.close()
+    
+    legacy_total = sum(legacy_sizes.values())
+    compact_total = sum(compact_sizes.values())
+    print(f"{args.rows} rows, {args.users} users, {len(domains)} domains; migrated in {migrate_seconds:.1f}s")
+    print(f"{'storage':<22}{'legacy':>12}{'compact':>12}")
+    for name in ("access_logs", "domains", "user_keys"):
+        print(f"  {name:<20}{legacy_sizes.get(name, 0) / 1e6:>10.1f}MB{compact_sizes.get(name, 0) / 1e6:>10.1f}MB")
+    print(f"  {'total':<20}{legacy_total / 1e6:>10.1f}MB{compact_total / 1e6:>10.1f}MB")
+    print(f"  {'bytes/row':<20}{legacy_total / args.rows:>12.0f}{compact_total / args.rows:>12.0f}")
+    print(f"{'query (median)':<22}{'legacy':>12}{'compact':>12}")
+    for name in legacy_times:
+        print(f"  {name:<20}{legacy_times[name]:>10.2f}ms{compact_times[name]:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
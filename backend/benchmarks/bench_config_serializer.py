@@ -0,0 +1,100 @@
+"""
+Benchmark Xray config emission for large client lists.
+
+Compares the old json.dump(indent=2) path with the streamed compact
+serializer (stdlib json and orjson). Every run happens in a fresh
+subprocess so peak RSS is measured per run.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_config_serializer [--users 10000 100000 500000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+MODES = ["legacy-indent", "stream-json", "stream-orjson"]
+
+
+def build_config(users: int) -> dict:
+    from app.services.xray_service import DEFAULT_CONFIG, CLIENT_FLOW
+    
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    config["inbounds"][0]["settings"]["clients"] = [
+        {"id": str(uuid.UUID(int=i)), "email": str(uuid.UUID(int=i)), "flow": CLIENT_FLOW}
+        for i in range(users)
+    ]
+    return config
+
+
+def run_one(mode: str, users: int) -> dict:
+    from app.services import xray_service
+    from app.utils import serialization
+    
+    config = build_config(users)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    if mode == "stream-json":
+        serialization.orjson = None
+    elif mode == "stream-orjson" and serialization.orjson is None:
+        return {"error": "orjson not installed"}
+    
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+        path = tmp.name
+    try:
+        start = time.perf_counter()
+        with open(path, "wb", buffering=xray_service.WRITE_BUFFER_SIZE) as f:
+            if mode == "legacy-indent":
+                text = json.dumps(config, indent=2, ensure_ascii=False)
+                f.write(text.encode("utf-8"))
+            else:
+                for chunk in xray_service.iter_config_chunks(config):
+                    f.write(chunk)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+    finally:
+        os.unlink(path)
+    
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "seconds": elapsed,
+        "file_mb": size / 1024 / 1024,
+        "peak_rss_mb": peak_kb / 1024,
+        "extra_rss_mb": (peak_kb - baseline_kb) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "USERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        print(json.dumps(run_one(args.child[0], int(args.child[1]))))
+        return
+    
+    print(f"{'users':>8} {'mode':<14} {'time (s)':>9} {'file (MB)':>10} {'peak RSS (MB)':>14} {'serializer RSS (MB)':>20}")
+    for users in args.users:
+        for mode in MODES:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_config_serializer", "--child", mode, str(users)],
+                capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            if "error" in result:
+                print(f"{users:>8} {mode:<14} {result['error']}")
+                continue
+            print(
+                f"{users:>8} {mode:<14} {result['seconds']:>9.3f} {result['file_mb']:>10.1f} "
+                f"{result['peak_rss_mb']:>14.1f} {result['extra_rss_mb']:>20.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark domain search in the access log domain dictionary.
+
+Fills a temporary SQLite database with N domain names through
+AccessLogWriter (so the domains_fts triggers run as during ingest) and
+times resolving the matching dictionary IDs for each query form, with the
+index AccessLogService picks and with the LIKE '%x%' scan it replaces:
+the first PER_DOMAIN_SEEKS + 1 IDs (what the endpoint fetches to pick its
+plan) and all of them (what an IN (...) subquery over the logs reads).
+Also times the dictionary inserts with and without the FTS triggers.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_domain_search [--domains 500000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def timed(fn, repeat: int = 10) -> float:
+    """Median milliseconds of fn()"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def domain_names(count: int, seed: int = 0):
+    """Realistic-looking hosts: CDN shards, subdomains of a few thousand sites, random tails"""
+    rng = random.Random(seed)
+    sites = [f"site{i}.com" for i in range(5000)]
+    names = set()
+    while len(names) < count:
+        kind = rng.random()
+        if kind < 0.2:
+            names.add(f"rr{rng.randint(1, 20)}---sn-{rng.getrandbits(24):06x}.googlevideo.com")
+        elif kind < 0.8:
+            names.add(f"{rng.choice(['www', 'api', 'cdn', 'static', 'img'])}{rng.randint(0, 99)}.{rng.choice(sites)}")
+        else:
+            names.add(f"{rng.getrandbits(40):010x}.example{rng.randint(0, 999)}.net")
+    return sorted(names, key=lambda _: rng.random())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domains", type=int, default=500_000)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    
+    from sqlalchemy import select, text
+    import app.models  # noqa: F401  (registers the tables)
+    from app.database import SessionLocal, engine, init_db
+    from app.models import Domain
+    from app.services.access_log_service import PER_DOMAIN_SEEKS, AccessLogService, AccessLogWriter
+    
+    init_db()
+    names = domain_names(args.domains)
+    half = len(names) // 2
+    
+    def insert(batch):
+        db = SessionLocal()
+        writer = AccessLogWriter()
+        started = time.perf_counter()
+        for start in range(0, len(batch), 5000):
+            writer.domain_ids(db, set(batch[start:start + 5000]))
+        db.commit()
+        db.close()
+        return len(batch) / (time.perf_counter() - started)
+    
+    # First half with the FTS triggers, second half without, then rebuild
+    with_fts = insert(names[:half])
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER domains_fts_insert"))
+    without_fts = insert(names[half:])
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TRIGGER domains_fts_insert AFTER INSERT ON domains BEGIN "
+            "INSERT INTO domains_fts (rowid, name) VALUES (new.id, new.name); END"
+        ))
+        conn.execute(text("INSERT INTO domains_fts (domains_fts) VALUES ('rebuild')"))
+    
+    db = SessionLocal()
+    service = AccessLogService(db)
+    queries = [
+        ("suffix", "*.googlevideo.com"),
+        ("suffix (one site)", "*.site42.com"),
+        ("substring (common)", "googlevideo"),
+        ("substring (rare)", "site4242"),
+        ("substring (short)", "rr"),
+    ]
+    print(f"{len(names)} domains; inserts {with_fts:,.0f}/s with the FTS triggers, {without_fts:,.0f}/s without")
+    print(f"{'query (median ms)':<40}{'matches':>9}{'first: index':>14}{'LIKE':>9}{'all: index':>12}{'LIKE':>9}")
+    for label, query in queries:
+        matches = service.domain_matches(query)
+        scan = select(Domain.id).where(Domain.name.contains(query.lstrip("*")))
+        count = len(db.scalars(matches).all())
+        first = [
+            timed(lambda: db.scalars(stmt.limit(PER_DOMAIN_SEEKS + 1)).all(), repeat)
+            for stmt, repeat in ((matches, 10), (scan, 3))
+        ]
+        every = [timed(lambda: db.scalars(stmt).all(), repeat) for stmt, repeat in ((matches, 5), (scan, 3))]
+        print(f"  {label + ' ' + query:<38}{count:>9}{first[0]:>14.2f}{first[1]:>9.2f}{every[0]:>12.2f}{every[1]:>9.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark access log ingestion.
+
+Writes a synthetic Xray access log (app.tools.gen_access_log) for N users
+into a temporary directory and ingests it into a temporary SQLite database
+with AccessLogIngester, reporting parse-only and end-to-end (parse + insert)
+lines/s.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_log_ingest [--lines 500000] [--users 1000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    
+    from sqlalchemy import func, select
+    from app.database import SessionLocal
+    from app.models import AccessLog
+    from app.services.log_ingester import AccessLogIngester
+    from app.tools.gen_access_log import create_users, user_uuids, write_log
+    from app.utils.access_log import AccessLogParser
+    
+    emails = user_uuids(args.users)
+    create_users(emails)
+    
+    log_file = os.path.join(workdir, "access.log")
+    write_log(log_file, args.lines, emails)
+    size_mb = os.path.getsize(log_file) / 1024 / 1024
+    
+    log_parser = AccessLogParser()
+    start = time.perf_counter()
+    with open(log_file, "rb") as f:
+        parsed = sum(1 for line in f if log_parser.parse(line.decode("utf-8", "replace")))
+    parse_seconds = time.perf_counter() - start
+    
+    ingester = AccessLogIngester(path=log_file)
+    start = time.perf_counter()
+    while ingester.ingest_once():
+        pass
+    ingest_seconds = time.perf_counter() - start
+    db = SessionLocal()
+    stored = db.scalar(select(func.count()).select_from(AccessLog))
+    db.close()
+    
+    assert parsed == args.lines and stored == args.lines, (parsed, stored)
+    print(f"{args.lines} lines ({size_mb:.1f} MB), {args.users} users")
+    print(f"{'parse only':<22}{parse_seconds:>8.2f}s  {args.lines / parse_seconds:>10,.0f} lines/s")
+    print(f"{'parse + insert':<22}{ingest_seconds:>8.2f}s  {args.lines / ingest_seconds:>10,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
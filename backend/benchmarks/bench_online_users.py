@@ -0,0 +1,196 @@
+"""
+Benchmark /monitoring/online-users with many online users.
+
+Creates N users with two devices each in a temporary SQLite database and
+starts a stub StatsService process reporting all of them online with
+unsynced traffic, with the throughput sampler and the monitoring feed
+running as in the app. Times:
+
+- a rebuild of the list, as the feed does it every tick (bulk queries and
+  JSON serialization, unsynced traffic from the sampler)
+- the endpoint while it is being polled, served from the feed's prebuilt
+  body; requests are spread over a few feed ticks, so they include any
+  time spent waiting on a rebuild in progress
+- the endpoint with ips, which rebuilds on the request (--ips)
+- an estimate of the previous per-user path (one QueryStats and one
+  Device query per user, before building the response) from a sample
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_online_users [--users 10000] [--sample 500] [--ips]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent import futures
+from datetime import datetime
+
+import grpc
+
+GRPC_OPTIONS = [
+    ("grpc.max_send_message_length", 64 * 1024 * 1024),
+    ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+]
+
+
+def serve_stub(emails, port_queue, stop_event):
+    """
+    Child process serving a StatsService that reports every given user
+    online with one IP. Out of process (like Xray) so it does not compete
+    with the endpoint for the GIL; responses are prebuilt.
+    """
+    from app.proto import stats_command_pb2, stats_command_pb2_grpc
+    
+    counters = [
+        stats_command_pb2.Stat(name=f"user>>>{email}>>>traffic>>>{direction}", value=i * 3)
+        for i, email in enumerate(emails)
+        for direction in ("uplink", "downlink")
+    ]
+    all_stats = stats_command_pb2.QueryStatsResponse(stat=counters)
+    online = stats_command_pb2.GetAllOnlineUsersResponse(users=[f"user>>>{email}>>>online" for email in emails])
+    
+    class StubStatsService(stats_command_pb2_grpc.StatsServiceServicer):
+        def QueryStats(self, request, context):
+            if request.pattern == "user>>>":
+                return all_stats
+            return stats_command_pb2.QueryStatsResponse(stat=[
+                stat for stat in counters if request.pattern in stat.name
+            ])
+        
+        def GetAllOnlineUsers(self, request, context):
+            return online
+        
+        def GetStatsOnlineIpList(self, request, context):
+            return stats_command_pb2.GetStatsOnlineIpListResponse(name=request.name, ips={"10.0.0.1": int(time.time())})
+    
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=8), options=GRPC_OPTIONS)
+    stats_command_pb2_grpc.add_StatsServiceServicer_to_server(StubStatsService(), server)
+    port_queue.put(server.add_insecure_port("127.0.0.1:0"))
+    server.start()
+    stop_event.wait()
+    server.stop(None)
+
+
+def create_devices(user_ids):
+    from sqlalchemy import insert
+    from app.database import SessionLocal
+    from app.models import Device
+    
+    now = datetime.utcnow()
+    db = SessionLocal()
+    db.execute(insert(Device.__table__), [
+        {
+            "id": str(uuid.uuid4()), "user_id": user_id, "fingerprint": f"fp-{user_id}-{n}",
+            "user_agent": "v2rayNG/1.8", "last_seen": now, "created_at": now,
+        }
+        for user_id in user_ids
+        for n in range(2)
+    ])
+    db.commit()
+    db.close()
+
+
+async def timed(repeat, call, pause=0.0):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        times.append(time.perf_counter() - start)
+        await asyncio.sleep(pause)
+    return times
+
+
+async def run(args):
+    from sqlalchemy import select
+    from app.database import SessionLocal
+    from app.models import Device, User
+    from app.routers.monitoring import get_online_users
+    from app.services.monitoring_feed import monitoring_feed
+    from app.services.stats_service import StatsService
+    from app.services.throughput_service import throughput
+    from app.utils.serialization import dumps_compact
+    
+    throughput.start()
+    monitoring_feed.start()
+    db = SessionLocal()
+    try:
+        while throughput.unsynced() is None:
+            await asyncio.sleep(0.1)
+        
+        async def rebuild():
+            dumps_compact(await StatsService(db).list_online_users(unsynced=throughput.unsynced()))
+        
+        times = {"rebuild (feed tick)": await timed(args.repeat, rebuild)}
+        
+        # The first request builds the body and keeps the feed rebuilding it
+        body = (await get_online_users(ips=False, db=db, admin=None)).body
+        times["served (polling)"] = await timed(
+            args.repeat, lambda: get_online_users(ips=False, db=db, admin=None),
+            pause=3 * monitoring_feed.interval / args.repeat,
+        )
+        if args.ips:
+            times["ips (rebuilt)"] = await timed(args.repeat, lambda: get_online_users(ips=True, db=db, admin=None))
+        
+        # The previous per-user loop body: one QueryStats and one Device query per user
+        stats_service = StatsService(db)
+        users = db.scalars(select(User).limit(args.sample)).all()
+        start = time.perf_counter()
+        for user in users:
+            await stats_service.get_user_traffic(user.uuid)
+            db.query(Device).filter(Device.user_id == user.id).all()
+        per_user = (time.perf_counter() - start) / len(users)
+    finally:
+        db.close()
+        await monitoring_feed.stop()
+        await throughput.stop()
+    return body, times, per_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--sample", type=int, default=500, help="users to time on the per-user path")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--ips", action="store_true", help="also fetch IP lists (one call per user)")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    
+    from sqlalchemy import select
+    from app.database import SessionLocal
+    from app.models import User
+    from app.services.xray_grpc_client import xray_grpc
+    from app.tools.gen_access_log import create_users, user_uuids
+    
+    emails = user_uuids(args.users)
+    create_users(emails)
+    db = SessionLocal()
+    create_devices(list(db.scalars(select(User.id))))
+    db.close()
+    
+    port_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    stub = multiprocessing.Process(target=serve_stub, args=(emails, port_queue, stop_event))
+    stub.start()
+    xray_grpc.address = f"127.0.0.1:{port_queue.get()}"
+    try:
+        body, times, per_user = asyncio.run(run(args))
+    finally:
+        stop_event.set()
+        stub.join()
+    
+    print(f"{args.users} online users, {2 * args.users} devices, {len(body) / 1e6:.1f} MB response")
+    for label, runs in times.items():
+        print(f"{label + ' (median)':<28}{statistics.median(runs) * 1000:>10.1f}ms"
+              f"  (min {min(runs) * 1000:.1f}ms, max {max(runs) * 1000:.1f}ms over {args.repeat} runs)")
+    print(f"{'per-user loop (est.)':<28}{per_user * args.users * 1000:>10.1f}ms"
+          f"  ({per_user * 1e6:.0f}us/user over {args.sample} sampled)")
+
+
+if __name__ == "__main__":
+    main()
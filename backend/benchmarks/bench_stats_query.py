@@ -0,0 +1,103 @@
+"""
+Benchmark user traffic collection from the Xray StatsService.
+
+Starts an in-process stub StatsService holding uplink/downlink counters for
+N users and compares the old per-user path (two GetStats calls per user,
+sampled and extrapolated) with a single QueryStats("user>>>") call parsed
+by parse_user_traffic.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_stats_query [--users 50000] [--sample 2000]
+"""
+import argparse
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+from app.proto import stats_command_pb2, stats_command_pb2_grpc
+from app.services.xray_grpc_client import MAX_MESSAGE_LENGTH, parse_user_traffic
+
+
+class StubStatsService(stats_command_pb2_grpc.StatsServiceServicer):
+    """Minimal StatsService backed by a dict of counters"""
+    
+    def __init__(self, counters):
+        self.counters = counters
+    
+    def GetStats(self, request, context):
+        value = self.counters.get(request.name)
+        if value is None:
+            context.abort(grpc.StatusCode.UNKNOWN, f"{request.name} not found")
+        return stats_command_pb2.GetStatsResponse(
+            stat=stats_command_pb2.Stat(name=request.name, value=value)
+        )
+    
+    def QueryStats(self, request, context):
+        return stats_command_pb2.QueryStatsResponse(stat=[
+            stats_command_pb2.Stat(name=name, value=value)
+            for name, value in self.counters.items()
+            if request.pattern in name
+        ])
+
+
+def build_counters(users: int) -> dict:
+    counters = {}
+    for i in range(users):
+        user_id = str(uuid.UUID(int=i))
+        counters[f"user>>>{user_id}>>>traffic>>>uplink"] = i * 3
+        counters[f"user>>>{user_id}>>>traffic>>>downlink"] = i * 7
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--sample", type=int, default=2000,
+                        help="users to time on the per-user path before extrapolating")
+    args = parser.parse_args()
+    
+    counters = build_counters(args.users)
+    options = [
+        ("grpc.max_send_message_length", MAX_MESSAGE_LENGTH),
+        ("grpc.max_receive_message_length", MAX_MESSAGE_LENGTH),
+    ]
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4), options=options)
+    stats_command_pb2_grpc.add_StatsServiceServicer_to_server(StubStatsService(counters), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    
+    channel = grpc.insecure_channel(f"127.0.0.1:{port}", options=options)
+    stub = stats_command_pb2_grpc.StatsServiceStub(channel)
+    try:
+        sample = min(args.sample, args.users)
+        start = time.perf_counter()
+        for i in range(sample):
+            user_id = str(uuid.UUID(int=i))
+            for direction in ("uplink", "downlink"):
+                stub.GetStats(stats_command_pb2.GetStatsRequest(
+                    name=f"user>>>{user_id}>>>traffic>>>{direction}"
+                ))
+        per_user = (time.perf_counter() - start) / sample
+        
+        start = time.perf_counter()
+        response = stub.QueryStats(stats_command_pb2.QueryStatsRequest(pattern="user>>>"))
+        rpc_done = time.perf_counter()
+        users_stats = parse_user_traffic({stat.name: stat.value for stat in response.stat})
+        parse_done = time.perf_counter()
+    finally:
+        channel.close()
+        server.stop(None)
+    
+    assert len(users_stats) == args.users
+    print(f"{len(counters)} counters, {args.users} users")
+    print(f"{'per-user GetStats (est.)':<28}{per_user * args.users:>10.2f}s"
+          f"  ({2 * args.users} RPCs, {per_user * 1e6:.0f}us/user over {sample} sampled)")
+    print(f"{'single QueryStats':<28}{parse_done - start:>10.2f}s"
+          f"  (rpc {rpc_done - start:.2f}s, parse {parse_done - rpc_done:.2f}s,"
+          f" {response.ByteSize() / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
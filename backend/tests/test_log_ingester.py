@@ -0,0 +1,123 @@
+import logging
+import os
+
+import pytest
+
+from app.models import AccessLog, Domain, LogCheckpoint, User
+from app.services.log_ingester import AccessLogIngester
+
+
+def line(domain, email="client-1", second=0):
+    return (f"2026/01/10 12:00:{second:02d}.123456 from 1.2.3.4:5678 accepted "
+            f"tcp:{domain}:443 [vless-reality -> direct] email: {email}\n").encode()
+
+
+def append(path, data):
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def ingested(db):
+    """Domains of the stored access logs, in insertion order"""
+    db.expire_all()
+    return [name for name, in db.query(Domain.name).join(AccessLog, AccessLog.domain_id == Domain.id)
+            .order_by(AccessLog.id)]
+
+
+@pytest.fixture
+def log(db, tmp_path):
+    db.add(User(username="client", uuid="client-1"))
+    db.commit()
+    return tmp_path / "access.log"
+
+
+def ingester(path):
+    return AccessLogIngester(path=str(path), batch_size=2)
+
+
+def test_checkpoint_survives_a_restart(db, log):
+    append(log, line("a.com") + line("b.com") + line("c.com"))
+    assert ingester(log).ingest_once() == log.stat().st_size
+    
+    append(log, line("d.com"))
+    ingester(log).ingest_once()
+    
+    assert ingested(db) == ["a.com", "b.com", "c.com", "d.com"]
+    checkpoint = db.get(LogCheckpoint, str(log))
+    assert (checkpoint.inode, checkpoint.offset) == (log.stat().st_ino, log.stat().st_size)
+
+
+def test_unknown_clients_and_other_lines_are_read_past(db, log):
+    append(log, line("a.com", email="nobody") + b"2026/01/10 12:00:00 rejected something\n" + line("b.com"))
+    ingester(log).ingest_once()
+    
+    assert ingested(db) == ["b.com"]
+    assert db.get(LogCheckpoint, str(log)).offset == log.stat().st_size
+
+
+def test_partial_last_line_waits_for_its_newline(db, log):
+    ingest = ingester(log)
+    full = line("b.com")
+    append(log, line("a.com") + full[:20])
+    ingest.ingest_once()
+    
+    assert ingested(db) == ["a.com"]
+    assert db.get(LogCheckpoint, str(log)).offset == len(line("a.com"))
+    
+    append(log, full[20:])
+    ingest.ingest_once()
+    assert ingested(db) == ["a.com", "b.com"]
+
+
+def test_rotation_reads_the_rest_of_the_old_file_first(db, log):
+    ingest = ingester(log)
+    append(log, line("a.com"))
+    ingest.ingest_once()
+    # Written after the last run, then the file is rotated away
+    append(log, line("b.com"))
+    os.rename(log, log.with_name("access.log.1"))
+    append(log, line("c.com"))
+    
+    ingest.ingest_once()
+    
+    assert ingested(db) == ["a.com", "b.com", "c.com"]
+    checkpoint = db.get(LogCheckpoint, str(log))
+    assert (checkpoint.inode, checkpoint.offset) == (log.stat().st_ino, log.stat().st_size)
+
+
+def test_rotation_without_the_old_file_starts_the_new_one(db, log):
+    ingest = ingester(log)
+    append(log, line("a.com"))
+    ingest.ingest_once()
+    os.rename(log, log.with_name("access.log.1.gz"))
+    append(log, line("b.com"))
+    
+    ingest.ingest_once()
+    
+    assert ingested(db) == ["a.com", "b.com"]
+
+
+def test_truncated_file_is_read_from_the_start(db, log):
+    ingest = ingester(log)
+    append(log, line("a.com") + line("b.com"))
+    ingest.ingest_once()
+    inode = log.stat().st_ino
+    os.truncate(log, 0)
+    append(log, line("c.com"))
+    assert log.stat().st_ino == inode
+    
+    ingest.ingest_once()
+    
+    assert ingested(db) == ["a.com", "b.com", "c.com"]
+
+
+def test_missing_file_is_reported_once(db, log, caplog):
+    ingest = ingester(log)
+    with caplog.at_level(logging.WARNING, logger="app.services.log_ingester"):
+        assert ingest.ingest_once() == 0
+        assert ingest.ingest_once() == 0
+    assert len(caplog.records) == 1
+    
+    append(log, line("a.com"))
+    ingest.ingest_once()
+    assert ingested(db) == ["a.com"]
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import TrafficJournal, User
+from app.services import stats_service
+from app.services.stats_service import StatsService
+
+
+class StubClient:
+    """Xray stats client returning the given counters once, then nothing"""
+    
+    def __init__(self, counters=None):
+        self.counters = dict(counters or {})
+    
+    async def get_stats(self, pattern, reset=False):
+        counters, self.counters = self.counters, {}
+        return {name: value for name, value in counters.items() if name.startswith(pattern)}
+
+
+@pytest.fixture(autouse=True)
+def sync_lock(monkeypatch):
+    # asyncio.Lock binds to the first loop it waits on; each test runs its own loop
+    monkeypatch.setattr(stats_service, "_sync_lock", asyncio.Lock())
+
+
+def data_used(db, uuid):
+    db.expire_all()
+    return db.query(User.data_used).filter(User.uuid == uuid).scalar()
+
+
+async def sync_concurrently(count, client):
+    sessions = [SessionLocal() for _ in range(count)]
+    try:
+        return await asyncio.gather(*(
+            StatsService(session, grpc_client=client).sync_all_users_stats() for session in sessions
+        ))
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def test_concurrent_syncs_apply_the_journal_once(db):
+    db.add(User(username="a", uuid="ua", data_used=0))
+    db.add(TrafficJournal(user_uuid="ua", uplink=60, downlink=40))
+    db.commit()
+    
+    results = asyncio.run(sync_concurrently(4, StubClient()))
+    
+    assert sorted(results) == [0, 0, 0, 1]
+    
+    assert data_used(db, "ua") == 100
+    assert db.query(TrafficJournal).count() == 0
+
+
+def test_concurrent_syncs_count_read_counters_once(db):
+    db.add(User(username="a", uuid="ua", data_used=0))
+    db.commit()
+    client = StubClient({"user>>>ua>>>traffic>>>uplink": 30, "user>>>ua>>>traffic>>>downlink": 20})
+    
+    results = asyncio.run(sync_concurrently(3, client))
+    
+    assert sorted(results) == [0, 0, 1]
+    
+    assert data_used(db, "ua") == 50
+    assert not stats_service._unjournaled
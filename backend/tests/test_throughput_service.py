@@ -0,0 +1,54 @@
+from app.services.throughput_service import ThroughputMonitor
+
+
+def monitor():
+    return ThroughputMonitor(samples=4, interval=5)
+
+
+def current(monitor, uuid):
+    return monitor.rates(uuid)[0]
+
+
+def test_deltas_between_samples():
+    throughput = monitor()
+    throughput.record({"a": 1000, "b": 0}, now=0)
+    throughput.record({"a": 1500, "b": 100}, now=5)
+    
+    assert current(throughput, "a") == 100
+    assert current(throughput, "b") == 20
+    assert throughput.snapshot().current_bps == 120
+
+
+def test_reset_between_samples_keeps_the_bytes_before_it():
+    throughput = monitor()
+    throughput.record({"a": 1000}, now=0)
+    throughput.on_reset({"a": {"total": 1200}})
+    throughput.record({"a": 300}, now=5)
+    
+    assert current(throughput, "a") == (200 + 300) / 5
+
+
+def test_sample_read_across_a_reset_is_dropped():
+    throughput = monitor()
+    throughput.record({"a": 1000}, now=0)
+    generation = throughput.generation
+    # The sampler's read is in flight while the stats sync resets the counters
+    throughput.on_reset({"a": {"total": 1200}})
+    
+    assert not throughput.record({"a": 1200}, now=4, generation=generation)
+    assert throughput.record({"a": 300}, now=5, generation=throughput.generation)
+    assert current(throughput, "a") == (200 + 300) / 5
+    assert throughput.snapshot().peak_bps == 100
+
+
+def test_idle_users_leave_after_a_full_window():
+    throughput = monitor()
+    throughput.record({"a": 0}, now=0)
+    throughput.record({"a": 500}, now=5)
+    for second in (10, 15, 20):
+        throughput.record({"a": 500}, now=second)
+        assert throughput.snapshot().active_users == 1
+    
+    throughput.record({}, now=25)
+    assert throughput.snapshot().active_users == 0
+    assert throughput.unsynced() == {}
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import TrafficBucket
+from app.services.usage_service import DAY, HOUR, MINUTE, UsageService, to_epoch
+
+NOW = datetime(2026, 1, 10, 12, 20)
+OLD = NOW - timedelta(hours=30)  # Past minute retention, within hour retention
+
+
+def buckets(db, step):
+    return {
+        (row.user_id, row.bucket_start): (row.uplink, row.downlink)
+        for row in db.query(TrafficBucket).filter(TrafficBucket.step == step)
+    }
+
+
+def total(rows):
+    return sum(uplink + downlink for _, uplink, downlink in rows)
+
+
+def test_record_adds_to_the_current_minute(db):
+    usage = UsageService(db)
+    usage.record([("u1", 10, 20)], now=NOW)
+    usage.record([("u1", 1, 2), ("u2", 5, 0)], now=NOW + timedelta(seconds=59))
+    usage.record([("u1", 100, 0)], now=NOW + timedelta(minutes=1))
+    db.commit()
+    
+    assert buckets(db, MINUTE) == {
+        ("u1", to_epoch(NOW)): (11, 22),
+        ("u2", to_epoch(NOW)): (5, 0),
+        ("u1", to_epoch(NOW) + MINUTE): (100, 0),
+    }
+
+
+def test_record_without_deltas_writes_nothing(db):
+    assert UsageService(db).record([], now=NOW) == 0
+
+
+def test_rollup_skips_the_current_hour_and_is_idempotent(db):
+    usage = UsageService(db)
+    usage.record([("u1", 10, 0)], now=NOW.replace(hour=11, minute=0))
+    usage.record([("u1", 5, 0)], now=NOW.replace(hour=11, minute=59))
+    usage.record([("u1", 7, 0)], now=NOW)
+    db.commit()
+    
+    usage.rollup(now=NOW)
+    usage.rollup(now=NOW)
+    
+    hour = to_epoch(NOW.replace(hour=11, minute=0))
+    assert buckets(db, HOUR) == {("u1", hour): (15, 0)}
+    assert usage.watermark(HOUR) == hour + HOUR
+
+
+def test_rollup_recomputes_the_newest_hour(db):
+    usage = UsageService(db)
+    usage.record([("u1", 10, 0)], now=NOW.replace(hour=11, minute=0))
+    db.commit()
+    usage.rollup(now=NOW)
+    # A late write into the hour already rolled up
+    usage.record([("u1", 5, 0)], now=NOW.replace(hour=11, minute=30))
+    db.commit()
+    usage.rollup(now=NOW)
+    
+    assert buckets(db, HOUR) == {("u1", to_epoch(NOW.replace(hour=11, minute=0))): (15, 0)}
+
+
+def test_rollup_drops_minutes_past_retention_after_summing_them(db):
+    usage = UsageService(db)
+    usage.record([("u1", 100, 200)], now=OLD)
+    usage.record([("u1", 1, 2)], now=NOW - timedelta(hours=23))
+    db.commit()
+    
+    usage.rollup(now=NOW)
+    
+    assert list(buckets(db, MINUTE)) == [("u1", to_epoch(NOW - timedelta(hours=23)))]
+    assert buckets(db, HOUR)[("u1", to_epoch(OLD.replace(minute=0)))] == (100, 200)
+    assert buckets(db, DAY) == {("u1", to_epoch(OLD.replace(hour=0, minute=0))): (101, 202)}
+
+
+def test_covering_step_at_the_retention_boundaries(db):
+    usage = UsageService(db)
+    assert usage.covering_step(NOW - timedelta(days=1), now=NOW) == MINUTE
+    assert usage.covering_step(NOW - timedelta(days=1, seconds=1), now=NOW) == HOUR
+    assert usage.covering_step(NOW - timedelta(days=31), now=NOW) == HOUR
+    assert usage.covering_step(NOW - timedelta(days=31, seconds=1), now=NOW) == DAY
+    assert usage.covering_step(NOW - timedelta(days=400), now=NOW) == DAY
+
+
+@pytest.fixture
+def history(db):
+    """Traffic 30 hours ago, an hour ago and in the current (not rolled up) hour"""
+    usage = UsageService(db)
+    for when, amount in ((OLD, 1000), (OLD + timedelta(hours=1), 500),
+                         (NOW - timedelta(hours=1), 300), (NOW - timedelta(minutes=5), 40)):
+        usage.record([("u1", amount, amount)], now=when)
+        db.commit()
+    usage.rollup(now=NOW)
+    return usage
+
+
+def test_query_rejects_a_step_finer_than_the_retained_tier(history):
+    with pytest.raises(ValueError):
+        history.query("u1", OLD, NOW, MINUTE, now=NOW)
+
+
+@pytest.mark.parametrize("step", [HOUR, 2 * HOUR, DAY])
+def test_query_across_tiers_counts_everything_once(history, step):
+    rows = history.query("u1", OLD, NOW, step, now=NOW)
+    assert total(rows) == 2 * (1000 + 500 + 300 + 40)
+
+
+def test_query_hours_reads_the_minute_tail_past_the_watermark(history):
+    rows = history.query("u1", OLD, NOW, HOUR, now=NOW)
+    by_point = {point: uplink for point, uplink, _ in rows}
+    
+    assert len(rows) == 31  # OLD is 06:20, aligned down to 06:00
+    assert by_point[to_epoch(OLD.replace(minute=0))] == 1000
+    assert by_point[to_epoch(OLD.replace(hour=7, minute=0))] == 500
+    assert by_point[to_epoch(NOW.replace(minute=0) - timedelta(hours=1))] == 300
+    assert by_point[to_epoch(NOW.replace(minute=0))] == 40
+
+
+def test_query_minutes_within_retention(history):
+    start = NOW - timedelta(hours=2)
+    rows = history.query("u1", start, NOW, MINUTE, now=NOW)
+    
+    assert len(rows) == 120
+    assert total(rows) == 2 * (300 + 40)
+    assert dict((point, uplink) for point, uplink, _ in rows)[to_epoch(NOW - timedelta(minutes=5))] == 40
+
+
+def test_total_bytes_of_the_last_day_to_the_minute(db):
+    usage = UsageService(db)
+    start = NOW - timedelta(days=1)
+    for when, amount in ((start - timedelta(minutes=1), 1), (start, 10), (start + timedelta(minutes=39), 100),
+                         (start + timedelta(minutes=40), 1000), (NOW - timedelta(minutes=30), 10000),
+                         (NOW - timedelta(minutes=1), 100000), (NOW, 1000000)):
+        usage.record([("u1", amount, 0), ("u2", 0, amount)], now=when)
+        db.commit()
+    
+    assert usage.total_bytes(start, NOW) == 2 * 111110
+    # Same once whole hours are only counted from the hour tier
+    usage.rollup(now=NOW)
+    db.query(TrafficBucket).filter(
+        TrafficBucket.step == MINUTE,
+        TrafficBucket.bucket_start >= to_epoch(start + timedelta(hours=1)),
+        TrafficBucket.bucket_start < to_epoch(NOW.replace(minute=0)),
+    ).delete()
+    assert usage.total_bytes(start, NOW) == 2 * 111110